@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from comments.models import Comment
+
+
+class Command(BaseCommand):
+    help = "Recomputes the materialized paths of every comment thread."
+
+    def handle(self, *args, **options):
+        threads = Comment.objects.order_by().values_list(
+            'item_content_type', 'item_id').distinct()
+        updated = 0
+        for content_type, item_id in threads.iterator():
+            comments = Comment.objects.filter(
+                item_content_type=content_type,
+                item_id=item_id,
+                ).order_by('pk').only('pk', 'parent', 'path')
+            paths = {}
+            with transaction.atomic():
+                # Parents are always older than their replies.
+                for comment in comments:
+                    path = comment.get_path(paths.get(comment.parent_id, ''))
+                    paths[comment.pk] = path
+                    if path != comment.path:
+                        Comment.objects.filter(pk=comment.pk).update(path=path)
+                        updated += 1
+        self.stdout.write("{} comment paths updated.".format(updated))
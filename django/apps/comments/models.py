@@ -1,11 +1,15 @@
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.generic import GenericForeignKey
 from django.core.urlresolvers import reverse
 from django.db import models
 
-from misc.models import Rejected
+from misc import counters, pages
+from misc.models import Rejected, Versioned, skip_fields
 from votes.models import Vote, Voted
 
+PATH_SEGMENT_LENGTH = 10
+
 
 class CommentManager(models.Manager):
 
@@ -13,6 +17,23 @@ class CommentManager(models.Manager):
         content_type = ContentType.objects.get_for_model(item)
         return self.filter(item_content_type=content_type, item_id=item.id)
 
+    def tree(self, item):
+        """Returns the comments of `item` in a single query, in thread
+        order: every comment is followed by its replies. Each comment gets
+        its direct `replies` too.
+        """
+        comments = self.filter_item(item).select_related('note', 'note__author')
+        comments = list(comments.order_by('path', 'pk'))
+        nodes = {}
+        for comment in comments:
+            comment.item = item
+            comment.replies = []
+            parent = nodes.get(comment.parent_id)
+            if parent is not None:
+                parent.replies.append(comment)
+            nodes[comment.pk] = comment
+        return comments
+
 
 class CommentVote(Vote):
     item = models.ForeignKey(
@@ -22,7 +43,7 @@ class CommentVote(Vote):
     unique_together = (('item', 'user'),)
 
 
-class Comment(Voted, Rejected):
+class Comment(Voted, Rejected, Versioned):
     note = models.ForeignKey(
         editable=False,
         to='notes.Note',
@@ -43,6 +64,12 @@ class Comment(Voted, Rejected):
         to='comments.Comment',
         null=True,
         )
+    path = models.CharField(
+        editable=False,
+        max_length=settings.COMMENT_PATH_LENGTH,
+        db_index=True,
+        blank=True,
+        )
     objects = CommentManager()
 
     # Voted attributes
@@ -64,7 +91,28 @@ class Comment(Voted, Rejected):
                 self.is_private = self.item.is_private
             except AttributeError:
                 pass
-        return super(Comment, self).save(**kwargs)
+            super(Comment, self).save(**kwargs)
+            self.path = self.get_path()
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+        else:
+            super(Comment, self).save(**kwargs)
+        slug = getattr(self.item, 'slug', None)
+        if slug is not None:
+            pages.invalidate('submission:{}'.format(slug))
+
+    def get_path(self, parent_path=None):
+        """Returns the materialized path, the padded ids of the ancestors
+        and the comment itself. Replies too deep are stored with the last
+        ancestor that fits, they still point to their actual parent.
+        """
+        if parent_path is None:
+            parent_path = self.parent.path if self.parent_id else ''
+        limit = settings.COMMENT_PATH_LENGTH - PATH_SEGMENT_LENGTH
+        return parent_path[:limit] + '{:010d}'.format(self.pk)
+
+    @property
+    def depth(self):
+        return max(len(self.path) // PATH_SEGMENT_LENGTH - 1, 0)
 
     def __unicode__(self):
         return unicode(self.note)
@@ -72,6 +120,9 @@ class Comment(Voted, Rejected):
     def get_absolute_url(self):
         return self.item.get_absolute_url() + '#comment-{}'.format(self.pk)
 
+    def get_parent_url(self):
+        return self.item.get_absolute_url() + '#comment-{}'.format(self.parent_id)
+
     def get_evaluate_url(self):
         return reverse('comments:evaluate', args=[self.pk])
 
@@ -94,6 +145,10 @@ class Commented(models.Model):
     class Meta:
         abstract = True
 
+    def save(self, **kwargs):
+        skip_fields(self, kwargs, ['comment_count'])
+        super(Commented, self).save(**kwargs)
+
     def get_comments(self):
         comments = Comment.objects.filter_item(item=self)
         comments = comments.select_related('note', 'note__author')
@@ -102,3 +157,14 @@ class Commented(models.Model):
 
     def update_comment_count(self):
         self.comment_count = self.get_comments().count()
+
+    def get_page_scopes(self):
+        """The scopes of the cached pages showing the item, see `misc.pages`."""
+        return []
+
+    def increment_comment_count(self, amount=1):
+        """Counts new comments without a full save, see `misc.counters`."""
+        counters.increment(self, 'comment_count', amount)
+        scopes = self.get_page_scopes()
+        if scopes:
+            pages.invalidate(*scopes)
@@ -18,6 +18,6 @@ def article(comment, cls=''):
     attr['class'] += ' private' if comment.note.is_private else ' public'
     attr['class'] += ' erased' if comment.note.is_erased else ' valid'
     attr['class'] += ' rejected' if comment.is_rejected else ' allowed'
-    if comment.parent is not None:
-        attr['data-parent'] = "comment-{}".format(comment.parent.pk)
+    if comment.parent_id is not None:
+        attr['data-parent'] = "comment-{}".format(comment.parent_id)
     return mark_safe(attribute_string(attr))
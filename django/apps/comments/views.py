@@ -38,8 +38,7 @@ class CommentCreateView(FormView):
         comment.item = item
         comment.save()
         comment.cast_vote(user=author, way='up')
-        comment.item.update_comment_count()
-        comment.item.save()
+        comment.item.increment_comment_count()
         msg.add_message(self.request, msg.SUCCESS, _('Comment saved.'))
         return HttpResponseRedirect(comment.get_absolute_url())
 
@@ -78,8 +77,7 @@ class CommentReplyView(SingleObjectMixin, FormView):
         reply.item = parent.item
         reply.save()
         reply.cast_vote(user=author, way='up')
-        reply.item.update_comment_count()
-        reply.item.save()
+        reply.item.increment_comment_count()
         msg.add_message(self.request, msg.SUCCESS, _('Comment saved.'))
         return HttpResponseRedirect(reply.get_absolute_url())
 
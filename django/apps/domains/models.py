@@ -1,8 +1,24 @@
-from tldextract import extract
+import threading
+from collections import OrderedDict
+
+from tldextract import TLDExtract
+from tldextract.tldextract import SCHEME_RE
+from django.conf import settings
 from django.db import models
 
+from misc import cascade
 from misc.models import Private, Rejected
 
+# Uses the public suffix list bundled with tldextract, never downloads it.
+extract = TLDExtract(suffix_list_url=None)
+
+
+def get_host(url):
+    """Same host `extract` works on, without the port."""
+    netloc = SCHEME_RE.sub('', url).partition('/')[0].partition('?')[0]
+    host = netloc.partition('#')[0].split('@')[-1].partition(':')[0]
+    return host.rstrip('.').lower()
+
 
 class Domain(Rejected, Private):
     """A second-level domain name."""
@@ -17,30 +33,64 @@ class Domain(Rejected, Private):
     def hide(self):
         self.domain_names.update(is_private=True)
         super(Domain, self).hide()
+        cascade.start(self, 'is_private', True)
 
     def reject(self):
         self.domain_names.update(is_rejected=True)
         super(Domain, self).reject()
+        cascade.start(self, 'is_rejected', True)
 
     def __unicode__(self):
         return unicode(self.domain)
 
 
 class DomainNameManager(models.Manager):
+    # <host, domain name id> of the last hosts seen by this process.
+    cache = OrderedDict()
+    lock = threading.Lock()
+
+    def get_cached(self, host):
+        """Returns the cached `DomainName` of the host, fresh from the
+        database, with its domain. None when it isn't cached or is gone.
+        """
+        with self.lock:
+            pk = self.cache.pop(host, None)
+            if pk is None:
+                return None
+            self.cache[host] = pk  # Most recently used goes last.
+        try:
+            return self.select_related('domain').get(pk=pk)
+        except DomainName.DoesNotExist:
+            with self.lock:
+                self.cache.pop(host, None)
+            return None
+
+    def set_cached(self, host, domain_name):
+        with self.lock:
+            self.cache.pop(host, None)
+            self.cache[host] = domain_name.pk
+            while len(self.cache) > settings.DOMAIN_CACHE_SIZE:
+                self.cache.popitem(last=False)
 
     def obtain(self, url):
         """Returns the `DomainName` object associated with the passed
         `url`. Creating it when necessary.
+        Hosts seen before take a single query.
         """
-        ext = extract(url)  # "http://www.forums.example.co.uk"
-        domain = '.'.join(ext[-2:])  # "example.co.uk"
-        subdomain = ext.subdomain  # "www.forums"
-        domain, created = Domain.objects.get_or_create(domain=domain)
-        domain_name = self.get_or_create(domain=domain, subdomain=subdomain)[0]
-        if not created:
-            domain_name.is_private = domain.is_private
-            domain_name.is_rejected = domain.is_rejected
-            domain_name.save()
+        host = get_host(url)
+        domain_name = self.get_cached(host)
+        if domain_name is None:
+            ext = extract(url)  # "http://www.forums.example.co.uk"
+            domain = '.'.join(ext[-2:])  # "example.co.uk"
+            subdomain = ext.subdomain  # "www.forums"
+            domain = Domain.objects.get_or_create(domain=domain)[0]
+            domain_name = self.get_or_create(domain=domain, subdomain=subdomain)[0]
+            self.set_cached(host, domain_name)
+        domain = domain_name.domain
+        flags = (domain.is_private, domain.is_rejected)
+        if flags != (domain_name.is_private, domain_name.is_rejected):
+            domain_name.is_private, domain_name.is_rejected = flags
+            domain_name.save(update_fields=['is_private', 'is_rejected'])
         return domain_name
 
 
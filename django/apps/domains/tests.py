@@ -53,3 +53,14 @@ class SimpleTest(TestCase):
         self.assertTrue(dna.is_rejected)
         self.assertTrue(dnb.is_rejected)
         self.assertTrue(dna.domain.is_rejected)
+
+    def test_cached_domain(self):
+        """Known hosts take a single query and see changes of the domain."""
+        url = "http://some.example-d.co.uk/something/"
+        dn = DomainName.objects.obtain(url)
+        with self.assertNumQueries(1):
+            dn = DomainName.objects.obtain("http://some.example-d.co.uk/else/")
+        dn.domain.reject()
+        dn = DomainName.objects.obtain(url)
+        self.assertTrue(dn.is_rejected)
+        self.assertTrue(DomainName.objects.get(pk=dn.pk).is_rejected)
@@ -0,0 +1,133 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, get_model
+
+from misc import pages
+from misc.models import Versioned
+from misc.stores import get_store
+
+"""Moderation cascades.
+Rejecting or hiding a domain, or banning a user, changes the flags of what
+came from them: submissions, comments and votes. Those rows are updated in
+the background in batches of `settings.CASCADE_BATCH_SIZE`, each in its own
+short transaction, so big cascades never hold locks for long. Items that
+lost or got back votes are rescored as their batch finishes.
+Progress is kept in the store while the cascade runs.
+"""
+
+
+def label(instance):
+    meta = instance._meta
+    return '{}.{}'.format(meta.app_label, meta.object_name.lower())
+
+
+def progress_key(instance_label, pk):
+    return 'cascade:{}:{}'.format(instance_label, pk)
+
+
+def get_targets(instance):
+    """Returns the querysets the flags of `instance` cascade to."""
+    from comments.models import Comment
+    from submissions.models import Submission
+    from votes.aggregates import voted_models
+    if label(instance) == 'domains.domain':
+        return [Submission.objects.filter(domain__domain=instance)]
+    if label(instance) == 'users.user':
+        targets = [
+            Submission.objects.filter(author=instance),
+            Comment.objects.filter(note__author=instance),
+            ]
+        for model in voted_models():
+            targets.append(model.vote_through.objects.filter(user=instance))
+        return targets
+    raise ValueError("Nothing cascades from {}.".format(label(instance)))
+
+
+def rescore(vote_model, pks):
+    """Rescores the items of the votes in `pks` after their flags changed."""
+    from votes import aggregates
+    model = vote_model._meta.get_field('item').rel.to
+    items = vote_model.objects.filter(pk__in=pks).values_list('item', flat=True)
+    items = set(items)
+    for pk, expected in aggregates.recompute(model, items).items():
+        aggregates.fix(model, pk, expected)
+    for item in model._default_manager.filter(pk__in=items):
+        item.compute_scores()
+        item.save(update_fields=item.get_score_fields())
+
+
+def after_batch(model, pks):
+    """Whatever depends on the flags of the updated rows."""
+    from submissions import feeds
+    from submissions.models import Submission
+    from votes.models import Vote
+    if issubclass(model, Vote):
+        rescore(model, pks)
+    elif model is Submission:
+        rows = Submission.objects.filter(pk__in=pks).values_list(*feeds.FIELDS)
+        feeds.refresh(rows)
+
+
+def update(queryset, field, value, batch_size):
+    """Sets `field` to `value` in every row of `queryset`, a batch at a
+    time. Yields the number of rows of each batch.
+    """
+    model = queryset.model
+    changes = {field: value}
+    if issubclass(model, Versioned):
+        changes['version'] = F('version') + 1
+    # Updated rows stop matching, a cascade run twice picks up where it was.
+    queryset = queryset.exclude(**{field: value}).order_by('pk')
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        with transaction.atomic():
+            model._default_manager.filter(pk__in=pks).update(**changes)
+        after_batch(model, pks)
+        yield len(pks)
+
+
+def run(instance, field, value, batch_size=None):
+    """Cascades `field` = `value` from `instance`. Returns the rows updated."""
+    batch_size = batch_size or settings.CASCADE_BATCH_SIZE
+    store = get_store()
+    key = progress_key(label(instance), instance.pk)
+    targets = get_targets(instance)
+    progress = {
+        'field': field,
+        'total': sum(t.exclude(**{field: value}).count() for t in targets),
+        'done': 0,
+        }
+    for queryset in targets:
+        for count in update(queryset, field, value, batch_size):
+            progress['done'] += count
+            store.set(key, json.dumps(progress), timeout=settings.CASCADE_TIMEOUT)
+    store.delete(key)
+    pages.invalidate('site')
+    return progress['done']
+
+
+def start(instance, field, value):
+    """Schedules the cascade of `field` = `value` from `instance`."""
+    from .tasks import cascade_task
+    get_store().set(
+        progress_key(label(instance), instance.pk),
+        json.dumps({'field': field, 'total': None, 'done': 0}),
+        timeout=settings.CASCADE_TIMEOUT,
+        )
+    cascade_task.delay(label(instance), instance.pk, field, value)
+
+
+def get_progress(instance):
+    """Returns a dict with the `field` being cascaded and the rows `done`
+    out of `total`, or None when no cascade is running.
+    """
+    progress = get_store().get(progress_key(label(instance), instance.pk))
+    return json.loads(progress) if progress else None
+
+
+def get_instance(instance_label, pk):
+    return get_model(*instance_label.split('.'))._default_manager.get(pk=pk)
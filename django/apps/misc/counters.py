@@ -0,0 +1,107 @@
+from django.db.models import Count, F, get_models
+
+from misc.models import Versioned
+
+"""Denormalized counters.
+Counters change with atomic `F()` increments of their own columns, so
+concurrent requests neither lose counts nor overwrite the rest of the row.
+The `Counter` definitions recompute them from the rows they count, to find
+and repair drift, vote aggregates included, see the `reconcile_counters`
+command.
+"""
+
+
+def increment(instance, field, amount=1):
+    """Adds `amount` to `field` in the row and in the instance. Versioned
+    items get a new version, their cached fragments show the counter.
+    """
+    changes = {field: F(field) + amount}
+    if isinstance(instance, Versioned):
+        changes['version'] = F('version') + 1
+        instance.version += 1
+    type(instance)._default_manager.filter(pk=instance.pk).update(**changes)
+    setattr(instance, field, getattr(instance, field) + amount)
+
+
+class Counter(object):
+    """The counter `fields` of `model`. `count(pks)` returns a dict of
+    <pk, <field, value>> with the actual values for the items in `pks`.
+    """
+
+    def __init__(self, name, model, fields, count):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.count = count
+
+    def drift(self, pks):
+        """Yields <pk, stored, expected> for the items in `pks` whose
+        stored counters are wrong.
+        """
+        rows = self.model._default_manager.filter(pk__in=pks)
+        rows = rows.values_list('pk', *self.fields)
+        expected = self.count(pks)
+        for row in rows:
+            pk, stored = row[0], dict(zip(self.fields, row[1:]))
+            if any(abs(stored[f] - expected[pk][f]) > 1e-6 for f in stored):
+                yield pk, stored, expected[pk]
+
+    def fix(self, pk, expected):
+        self.model._default_manager.filter(pk=pk).update(**expected)
+
+
+def count_subscribers(pks):
+    from zones.models import Subscription
+    result = dict((pk, {'size': 0}) for pk in pks)
+    rows = Subscription.objects.filter(zone__in=pks)
+    for row in rows.values('zone').annotate(Count('id')):
+        result[row['zone']]['size'] = row['id__count']
+    return result
+
+
+def count_comments(model):
+    def count(pks):
+        from django.contrib.contenttypes.models import ContentType
+        from comments.models import Comment
+        result = dict((pk, {'comment_count': 0}) for pk in pks)
+        rows = Comment.objects.filter(
+            item_content_type=ContentType.objects.get_for_model(model),
+            item_id__in=pks,
+            )
+        for row in rows.values('item_id').annotate(Count('id')):
+            result[row['item_id']]['comment_count'] = row['id__count']
+        return result
+    return count
+
+
+def count_votes(model):
+    def count(pks):
+        from votes import aggregates
+        return aggregates.recompute(model, pks)
+    return count
+
+
+def get_counters():
+    """Returns a dict of <name, `Counter`> of every counter."""
+    from comments.models import Commented
+    from votes.models import Voted
+    from zones.models import Zone
+    counters = [Counter('zones.zone.size', Zone, ('size',), count_subscribers)]
+    for model in get_models():
+        meta = model._meta
+        label = '{}.{}'.format(meta.app_label, meta.object_name.lower())
+        if issubclass(model, Commented):
+            counters.append(Counter(
+                label + '.comment_count',
+                model,
+                ('comment_count',),
+                count_comments(model),
+                ))
+        if issubclass(model, Voted):
+            counters.append(Counter(
+                label + '.votes',
+                model,
+                Voted.AGGREGATE_FIELDS,
+                count_votes(model),
+                ))
+    return dict((c.name, c) for c in counters)
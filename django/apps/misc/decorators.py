@@ -1,7 +1,10 @@
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 
+from . import pages
+
 
 def author_required_view(cls):
     """Decorates `cls.dispatch` class method to require the author."""
@@ -17,3 +20,25 @@ def author_required_view(cls):
 
     cls.dispatch = decorated_dispatch
     return cls
+
+
+def anonymous_cache_view(*scopes):
+    """Decorates `cls.dispatch` class method to cache the pages it renders
+    for anonymous users, see `misc.pages`. `scopes` are formatted with the
+    url keyword arguments, like "zone:{slug}". Other pages are private.
+    """
+    def decorator(cls):
+        original_dispatch = cls.dispatch
+
+        def decorated_dispatch(self, request, *args, **kwargs):
+            if not pages.is_cacheable(request):
+                response = original_dispatch(self, request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+            names = [s.format(**kwargs) for s in scopes]
+            render = lambda: original_dispatch(self, request, *args, **kwargs)
+            return pages.serve(request, names, render)
+
+        cls.dispatch = decorated_dispatch
+        return cls
+    return decorator
@@ -0,0 +1,74 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+# The SQL of the lookup and how the name is prepared for it.
+QUERIES = (
+    ('iexact', 'SELECT 1 FROM benchmark WHERE UPPER(name::text) = UPPER(%s)',
+     lambda name: name),
+    ('key', 'SELECT 1 FROM benchmark WHERE key = %s',
+     lambda name: name.lower()),
+    )
+
+
+def measure(cursor, sql, prepare, size, checks):
+    """Returns the average milliseconds per check, half of them for names
+    that exist and half for names that don't.
+    """
+    started = time.time()
+    for i in range(checks):
+        name = 'User{}'.format(random.randint(1, 2 * size))
+        cursor.execute(sql, [prepare(name)])
+        cursor.fetchall()
+    return 1000 * (time.time() - started) / checks
+
+
+class Command(BaseCommand):
+    help = ("Compares availability checks by case insensitive lookups, like "
+            "username__iexact, with lookups of indexed lower case keys, "
+            "in a temporary table of growing size.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--sizes',
+            dest='sizes',
+            default='10000,100000,1000000,3000000',
+            help="Comma separated table sizes to measure at.",
+            ),
+        make_option(
+            '--checks',
+            type='int',
+            dest='checks',
+            default=100,
+            help="Checks per lookup and size.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(','))
+        cursor = connection.cursor()
+        # Like the username and username_key columns of users.
+        cursor.execute(
+            'CREATE TEMPORARY TABLE benchmark ('
+            'name varchar(20) UNIQUE, key varchar(20) UNIQUE)'
+            )
+        rows = 0
+        try:
+            for size in sizes:
+                cursor.execute(
+                    "INSERT INTO benchmark SELECT 'User' || n, 'user' || n "
+                    "FROM generate_series(%s, %s) AS n",
+                    [rows + 1, size],
+                    )
+                cursor.execute('ANALYZE benchmark')
+                rows = size
+                line = ["{} rows".format(size)]
+                checks = options['checks']
+                for name, sql, prepare in QUERIES:
+                    average = measure(cursor, sql, prepare, size, checks)
+                    line.append("{}: {:.3f}ms".format(name, average))
+                self.stdout.write(' | '.join(line))
+        finally:
+            cursor.execute('DROP TABLE benchmark')
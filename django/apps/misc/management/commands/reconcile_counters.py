@@ -0,0 +1,84 @@
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from misc.counters import get_counters
+
+
+def check(job):
+    """Runs in the pool, every process opens its own connection."""
+    name, pks, fix = job
+    counter = get_counters()[name]
+    drifted = list(counter.drift(pks))
+    if fix:
+        for pk, stored, expected in drifted:
+            counter.fix(pk, expected)
+    return name, len(pks), drifted
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized counters and reports drift."
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--counter',
+            action='append',
+            dest='counters',
+            default=None,
+            help="Only COUNTER, like zones.zone.size. Can be repeated.",
+            ),
+        make_option(
+            '--fix',
+            action='store_true',
+            dest='fix',
+            default=False,
+            help="Overwrite drifted counters with the recomputed values.",
+            ),
+        make_option(
+            '--processes',
+            type='int',
+            dest='processes',
+            default=4,
+            help="Worker processes, each checks a chunk at a time.",
+            ),
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=1000,
+            help="Items checked per query.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        counters = get_counters()
+        names = options['counters'] or sorted(counters)
+        unknown = set(names) - set(counters)
+        if unknown:
+            raise CommandError("Unknown counters: {}. Known: {}.".format(
+                ', '.join(sorted(unknown)), ', '.join(sorted(counters))))
+        size = options['chunk_size']
+        jobs = []
+        for name in names:
+            queryset = counters[name].model._default_manager.order_by('pk')
+            pks = list(queryset.values_list('pk', flat=True))
+            for i in range(0, len(pks), size):
+                jobs.append((name, pks[i:i + size], options['fix']))
+        connection.close()  # Not to be shared with the forked processes.
+        pool = Pool(options['processes'])
+        checked = dict.fromkeys(names, 0)
+        drift = dict.fromkeys(names, 0)
+        try:
+            for name, count, drifted in pool.imap_unordered(check, jobs):
+                checked[name] += count
+                drift[name] += len(drifted)
+                for pk, stored, expected in drifted:
+                    self.stdout.write("{} {}: stored {}, expected {}".format(
+                        name, pk, stored, expected))
+        finally:
+            pool.terminate()
+        status = "fixed" if options['fix'] else "found"
+        for name in names:
+            self.stdout.write("{}: {} of {} items drifted, {}.".format(
+                name, drift[name], checked[name], status))
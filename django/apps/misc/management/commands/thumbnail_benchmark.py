@@ -0,0 +1,73 @@
+import multiprocessing
+import resource
+from cStringIO import StringIO
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from misc import thumbler
+
+
+def usage():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime, r.ru_maxrss
+
+
+def measure(conn, bytes, size, draft):
+    """Runs in a fresh process so that the peak RSS is the thumbnail's."""
+    cpu, rss = usage()
+    img = thumbler.decode(bytes, size if draft else None)
+    thumbler.resize_image(img, size).save(StringIO(), 'JPEG', quality=thumbler.QUALITY)
+    end_cpu, end_rss = usage()
+    conn.send((end_cpu - cpu, end_rss - rss))
+    conn.close()
+
+
+def run(bytes, size, draft):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=measure,
+        args=(child, bytes, size, draft),
+        )
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+class Command(BaseCommand):
+    args = '<image image ...>'
+    help = ("Measures CPU time and peak RSS of a thumbnail of every image, "
+            "decoding in draft mode and at full resolution.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--size',
+            dest='size',
+            default=None,
+            help="Thumbnail size as WIDTHxHEIGHT, THUMBNAIL_SIZE by default.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("No images given.")
+        size = settings.THUMBNAIL_SIZE
+        if options['size']:
+            size = tuple(int(n) for n in options['size'].split('x'))
+        totals = {True: [0, 0], False: [0, 0]}
+        for path in args:
+            with open(path, 'rb') as f:
+                bytes = f.read()
+            line = [path]
+            for draft in (True, False):
+                cpu, rss = run(bytes, size, draft)
+                totals[draft][0] += cpu
+                totals[draft][1] = max(totals[draft][1], rss)
+                line.append("{}: {:.1f}ms {}KB".format(
+                    'draft' if draft else 'full', cpu * 1000, rss))
+            self.stdout.write(' | '.join(line))
+        for draft in (True, False):
+            cpu, rss = totals[draft]
+            self.stdout.write("{}: {:.1f}ms per image, {}KB peak".format(
+                'draft' if draft else 'full', cpu * 1000 / len(args), rss))
@@ -1,11 +1,15 @@
 from collections import OrderedDict
 
 from django.conf import settings
-from django.core.paginator import Paginator, InvalidPage, PageNotAnInteger
+from django.core.paginator import InvalidPage
 from django.http import Http404
 from django.utils.translation import ugettext as _
 from django.views.generic.base import ContextMixin
 
+from votes.models import prefetch_votes
+from . import pages
+from .paginators import paginate
+
 
 # TODO: WIP
 class OrderedMixin(object):
@@ -16,9 +20,33 @@ class OrderedMixin(object):
         return self.request.GET.get('sort', self.default_order)
 
 
-class ItemListMixin(ContextMixin):
+class PageMixin(object):
+    """Gets the requested page of a list, ready to display."""
+
+    def get_page(self, object_list, page_size):
+        """Returns a pair <paginator, page>, with the votes of the user on
+        the items loaded and their authors in the surrogate keys.
+        """
+        try:
+            paginator, page = paginate(object_list, page_size, self.request.GET)
+        except InvalidPage:
+            raise Http404(_('Invalid page.'))
+        prefetch_votes(page.object_list, self.request.user)
+        authors = [i.author for i in page.object_list if hasattr(i, 'author')]
+        pages.add_user_keys(self.request, authors)
+        return paginator, page
+
+
+class CursorListMixin(PageMixin):
+    """Paginates the querysets of a `ListView` with cursors."""
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page = self.get_page(queryset, page_size)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+class ItemListMixin(PageMixin, ContextMixin):
     """Allows to use a paginated list of objects from any model."""
-    paginator_class = Paginator
     page_size = settings.SUBMISSIONS_PER_PAGE
     context_item_list_name = 'item_list'
 
@@ -29,14 +57,7 @@ class ItemListMixin(ContextMixin):
         context = super(ItemListMixin, self).get_context_data(**kwargs)
         # Add paginator to context
         queryset = self.get_item_list(**kwargs)
-        paginator = self.paginator_class(queryset, self.page_size)
-        page_number = self.request.GET.get('page', 1)
-        try:
-            page = paginator.page(page_number)
-        except PageNotAnInteger:
-            raise Http404(_('Invalid page.'))
-        except InvalidPage:
-            raise Http404(_('Invalid page.'))
+        paginator, page = self.get_page(queryset, self.page_size)
         page_context = {
             self.context_item_list_name: page.object_list,
             'paginator': paginator,
@@ -89,3 +89,40 @@ class Private(models.Model):
         self.is_private = True
         self.save()
 
+
+def skip_fields(instance, kwargs, names):
+    """Leaves the fields in `names` out of the `save` kwargs of an update,
+    for columns only changed atomically. Returns whether it's an update.
+    """
+    update = not instance._state.adding and not kwargs.get('force_insert')
+    if update:
+        fields = kwargs.get('update_fields')
+        if fields is None:
+            fields = [f.name for f in instance._meta.fields if not f.primary_key]
+        kwargs['update_fields'] = [f for f in fields if f not in names]
+    return update
+
+
+class Versioned(models.Model):
+    """Counts the changes of an item, the cached fragments of its templates
+    are keyed on the count. Every save adds one, atomically.
+    Must come after any base class that also overrides `save`.
+    """
+    version = models.PositiveIntegerField(
+        editable=False,
+        default=0,
+    )
+
+    class Meta:
+        abstract = True
+
+    def save(self, **kwargs):
+        update = skip_fields(self, kwargs, ['version'])
+        super(Versioned, self).save(**kwargs)
+        if update:
+            self.bump_version()
+
+    def bump_version(self):
+        queryset = type(self)._default_manager.filter(pk=self.pk)
+        queryset.update(version=models.F('version') + 1)
+        self.version += 1
@@ -0,0 +1,191 @@
+import json
+import time
+import urllib2
+from hashlib import md5
+from httplib import HTTPException
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+from misc.stores import get_store
+
+"""Whole page cache for anonymous users.
+Pages are cached by path and query string along with the generations of
+the scopes they show, like "zone:<slug>" or "submission:<slug>". Model
+events bump the generation of their scopes, and pages of an older
+generation, or older than `settings.PAGE_CACHE_TIMEOUT`, are stale.
+A stale page is regenerated by a single request while the others keep
+getting the stale copy, for up to `settings.PAGE_CACHE_STALE_TIMEOUT`.
+Every page is also in the "site" scope, bumped after moderation cascades.
+
+Pages served to anonymous users are public for `settings.MICROCACHE_TIMEOUT`,
+so the front end proxy caches them too. Their scopes, along with the users
+they show, go in the "Surrogate-Key" header, and the paths of every key
+are kept in the store to purge them from the proxy when the key changes,
+through `settings.PAGE_PURGE_URL`, see `salt/nginx/zoonas.conf`.
+"""
+
+
+def scope_key(scope):
+    return 'pages:scope:' + scope
+
+
+def page_key(path):
+    return 'pages:' + md5(path).hexdigest()
+
+
+def paths_key(scope):
+    return 'pages:paths:' + scope
+
+
+def invalidate(*scopes):
+    """Makes the pages of `scopes` stale, and purges them from the proxy."""
+    from .tasks import purge_task
+    store = get_store()
+    if any(scope.startswith('user:') for scope in scopes):
+        # Before the user scopes themselves, see `serve`.
+        store.incr(scope_key('users'))
+    for scope in scopes:
+        store.incr(scope_key(scope))
+    if settings.PAGE_PURGE_URL:
+        purge_task.delay(scopes)
+
+
+def purge(scopes):
+    """Drops the pages of `scopes` from the proxy. Returns the number of
+    pages purged, the rest were not cached or the proxy didn't answer.
+    """
+    store = get_store()
+    paths = set()
+    for scope in scopes:
+        paths.update(store.drain(paths_key(scope)))
+    purged = 0
+    for path in paths:
+        try:
+            url = settings.PAGE_PURGE_URL + path
+            urllib2.urlopen(url, timeout=settings.PAGE_PURGE_TIMEOUT).close()
+            purged += 1
+        except (IOError, HTTPException):
+            pass  # 404 when it wasn't cached.
+    return purged
+
+
+def add_keys(request, *keys):
+    """Adds scopes to the page being rendered, for the things it shows
+    that aren't known before rendering, like "user:<username>".
+    """
+    if hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys.extend(keys)
+
+
+def add_user_keys(request, users):
+    """Adds the "user:<username>" keys of `users` shown in the page, so
+    that erasing one of them purges it.
+    """
+    if hasattr(request, 'surrogate_keys'):
+        usernames = set(user.username for user in users)
+        add_keys(request, *(u'user:{}'.format(u) for u in sorted(usernames)))
+
+
+def publish(request, response, keys):
+    """Lets the proxy cache `response` under the surrogate `keys`."""
+    response['Cache-Control'] = 'public, max-age={}'.format(
+        settings.MICROCACHE_TIMEOUT)
+    response['Surrogate-Key'] = ' '.join(keys)
+    return response
+
+
+def record_path(request, keys):
+    """Keeps the path of `request` for `keys`, so that `purge` finds it.
+    The sets expire with the cached pages.
+    """
+    if settings.PAGE_PURGE_URL:
+        get_store().sadd_many(
+            [paths_key(key) for key in keys], request.get_full_path(),
+            timeout=settings.PAGE_CACHE_STALE_TIMEOUT)
+
+
+def get_generations(scopes):
+    store = get_store()
+    return [int(store.get(scope_key(s)) or 0) for s in scopes]
+
+
+def is_cacheable(request):
+    """Only anonymous GETs without pending messages are cached."""
+    return (
+        request.method in ('GET', 'HEAD') and
+        not request.user.is_authenticated() and
+        'messages' not in request.COOKIES
+        )
+
+
+def is_shareable(request, response):
+    """False for responses with anything particular to the visitor, like
+    a CSRF token, which middlewares set as cookies later on.
+    """
+    return (
+        response.status_code == 200 and
+        not response.cookies and
+        not request.META.get('CSRF_COOKIE_USED') and
+        not request.session.modified
+        )
+
+
+def cached_response(request, entry):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['Age'] = int(time.time() - entry['created'])
+    return publish(request, response, entry['keys'])
+
+
+def serve(request, scopes, render):
+    """Returns the cached page of `request` if it's fresh, otherwise the
+    response of `render`, which is cached when it can be.
+    """
+    store = get_store()
+    key = page_key(request.get_full_path())
+    scopes = ['site'] + scopes
+    request.surrogate_keys = list(scopes)
+    entry = store.get(key)
+    locked = False
+    if entry is not None:
+        entry = json.loads(entry)
+        generations = get_generations(entry['keys'])
+        fresh = time.time() - entry['created'] < settings.PAGE_CACHE_TIMEOUT
+        if fresh and entry['generations'] == generations:
+            return cached_response(request, entry)
+        lock = settings.PAGE_CACHE_LOCK_TIMEOUT
+        locked = store.add(key + ':lock', 1, timeout=lock)
+        if not locked:
+            # Somebody else regenerates it.
+            return cached_response(request, entry)
+    # Read before rendering, changes meanwhile make the new page stale.
+    # The users shown are only known after rendering, so any change to a
+    # user scope during it, counted in "users", leaves the page uncached.
+    generations = get_generations(scopes)
+    users = get_generations(['users'])
+    try:
+        response = render()
+        if hasattr(response, 'render'):
+            response.render()
+        keys = request.surrogate_keys
+        generations += get_generations(keys[len(scopes):])
+        unchanged = get_generations(['users']) == users
+        if unchanged and is_shareable(request, response):
+            publish(request, response, keys)
+            record_path(request, keys)
+            entry = {
+                'generations': generations,
+                'keys': keys,
+                'created': time.time(),
+                'content': response.content.decode('utf-8'),
+                'content_type': response['Content-Type'],
+                }
+            timeout = settings.PAGE_CACHE_STALE_TIMEOUT
+            store.set(key, json.dumps(entry), timeout=timeout)
+        else:
+            patch_cache_control(response, private=True)
+    finally:
+        if locked:
+            store.delete(key + ':lock')
+    return response
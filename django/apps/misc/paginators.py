@@ -0,0 +1,142 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Model, Q
+from django.db.models.query import QuerySet
+
+"""Keyset pagination.
+Instead of counting rows and skipping an offset, pages start right after
+(or end right before) the last item shown, given by a cursor with the
+values of the ordering columns of that item. Every page costs the same no
+matter how deep it is.
+"""
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise InvalidPage("Invalid cursor.")
+
+
+class CursorPage(object):
+    """Same interface as `django.core.paginator.Page` minus page numbers,
+    templates use `next_cursor` and `previous_cursor` for the links.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(object):
+    """Paginates a queryset seeking on its ordering columns. The primary
+    key is added as the last column to make the ordering total.
+    """
+
+    def __init__(self, queryset, per_page):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        names = [o.lstrip('-') for o in ordering]
+        if 'pk' not in names and 'id' not in names:
+            descending = ordering and ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def get_values(self, item):
+        values = []
+        for field in self.ordering:
+            value = item
+            for name in field.lstrip('-').split('__'):
+                value = getattr(value, name)
+            values.append(value.pk if isinstance(value, Model) else value)
+        return values
+
+    def seek(self, values, forward):
+        """Returns the filter for items after `values`, or before them when
+        not `forward`.
+        """
+        if len(values) != len(self.ordering):
+            raise InvalidPage("Invalid cursor.")
+        query = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            term = dict(equal, **{'{}__{}'.format(name, lookup): value})
+            query |= Q(**term)
+            equal[name] = value
+        return query
+
+    def get_queryset(self, after, before):
+        if before is not None:
+            queryset = self.queryset.filter(self.seek(decode_cursor(before), False))
+            return queryset.reverse()
+        if after is not None:
+            return self.queryset.filter(self.seek(decode_cursor(after), True))
+        return self.queryset
+
+    def page(self, after=None, before=None):
+        """Returns the page after the cursor `after`, or before `before`,
+        or the first page.
+        """
+        try:
+            queryset = self.get_queryset(after, before)
+            items = list(queryset[:self.per_page + 1])
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidPage("Invalid cursor.")  # Values of the wrong type.
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if before is not None:
+            items.reverse()
+        first = encode_cursor(self.get_values(items[0])) if items else None
+        last = encode_cursor(self.get_values(items[-1])) if items else None
+        if before is not None:
+            return CursorPage(items, last, first if more else None)
+        return CursorPage(items, last if more else None, first if after else None)
+
+
+def paginate(object_list, per_page, params):
+    """Returns a pair <paginator, page> for the request GET `params`.
+    Querysets use cursors, lists with a `paginate` method paginate
+    themselves, other lists use page numbers.
+    Raises `InvalidPage` for bad parameters.
+    """
+    if hasattr(object_list, 'paginate'):
+        return object_list.paginate(per_page, params)
+    if isinstance(object_list, QuerySet):
+        paginator = CursorPaginator(object_list, per_page)
+        page = paginator.page(params.get('after'), params.get('before'))
+    else:
+        paginator = Paginator(object_list, per_page)
+        page = paginator.page(params.get('page', 1))
+    return paginator, page
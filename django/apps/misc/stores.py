@@ -0,0 +1,191 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_by_path
+
+"""Small key-value stores for state shared between web and celery workers.
+`RedisStore` uses the same redis instance as celery, `LocalStore` keeps
+everything in memory and is meant for tests and single process setups.
+Values are always strings, callers take care of serializing.
+"""
+
+_store = None
+
+
+def get_store():
+    """Returns the store configured in `settings.STORE_BACKEND`."""
+    global _store
+    if _store is None:
+        _store = import_by_path(settings.STORE_BACKEND)()
+    return _store
+
+
+class RedisStore(object):
+
+    def __init__(self, url=None):
+        import redis
+        self.client = redis.StrictRedis.from_url(url or settings.REDIS_URL)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(key, value, ex=timeout)
+
+    def add(self, key, value, timeout=None):
+        """Sets the key only if it doesn't exist. True when it was set."""
+        return bool(self.client.set(key, value, ex=timeout, nx=True))
+
+    def delete(self, *keys):
+        self.client.delete(*keys)
+
+    def incr(self, key, amount=1):
+        return self.client.incr(key, amount)
+
+    def sadd(self, key, *members):
+        self.client.sadd(key, *members)
+
+    def sadd_many(self, keys, member, timeout=None):
+        """Adds `member` to the sets at `keys`, which expire after `timeout`."""
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.sadd(key, member)
+            if timeout is not None:
+                pipe.expire(key, timeout)
+        pipe.execute()
+
+    def drain(self, key):
+        """Removes the set at `key` and returns its members."""
+        pipe = self.client.pipeline()
+        pipe.smembers(key)
+        pipe.delete(key)
+        members, deleted = pipe.execute()
+        return members
+
+    def zadd(self, key, mapping):
+        """Adds or updates the <member, score> pairs of `mapping`."""
+        args = []
+        for member, score in mapping.items():
+            args.extend((score, member))
+        if args:
+            self.client.zadd(key, *args)
+
+    def zrem(self, key, *members):
+        self.client.zrem(key, *members)
+
+    def zcard(self, key):
+        return self.client.zcard(key)
+
+    def zrevrange(self, key, start, stop, withscores=False):
+        """Returns members from highest to lowest score, `stop` included.
+        With `withscores` returns <member, score> pairs instead.
+        """
+        return self.client.zrevrange(key, start, stop, withscores=withscores)
+
+    def ztrim(self, key, size):
+        """Keeps the `size` highest members. Returns how many were removed."""
+        return self.client.zremrangebyrank(key, 0, -size - 1)
+
+
+class LocalStore(object):
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.RLock()
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key) if self._alive(key) else None
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.data[key] = str(value)
+            if timeout is None:
+                self.expires.pop(key, None)
+            else:
+                self.expires[key] = time.time() + timeout
+
+    def add(self, key, value, timeout=None):
+        with self.lock:
+            if self._alive(key):
+                return False
+            self.set(key, value, timeout)
+            return True
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            value = int(self.get(key) or 0) + amount
+            self.data[key] = str(value)
+            return value
+
+    def sadd(self, key, *members):
+        with self.lock:
+            if not self._alive(key):
+                self.data[key] = set()
+            self.data[key].update(str(m) for m in members)
+
+    def sadd_many(self, keys, member, timeout=None):
+        with self.lock:
+            for key in keys:
+                self.sadd(key, member)
+                if timeout is not None:
+                    self.expires[key] = time.time() + timeout
+
+    def drain(self, key):
+        with self.lock:
+            members = self.data.pop(key, set()) if self._alive(key) else set()
+            self.expires.pop(key, None)
+            return members
+
+    def _zset(self, key):
+        if not self._alive(key):
+            self.data[key] = {}
+        return self.data[key]
+
+    def _ranked(self, key):
+        zset = self._zset(key)
+        return sorted(zset, key=lambda m: (zset[m], m), reverse=True)
+
+    def zadd(self, key, mapping):
+        with self.lock:
+            zset = self._zset(key)
+            zset.update((str(m), float(s)) for m, s in mapping.items())
+
+    def zrem(self, key, *members):
+        with self.lock:
+            zset = self._zset(key)
+            for member in members:
+                zset.pop(str(member), None)
+
+    def zcard(self, key):
+        with self.lock:
+            return len(self._zset(key))
+
+    def zrevrange(self, key, start, stop, withscores=False):
+        with self.lock:
+            members = self._ranked(key)[start:None if stop == -1 else stop + 1]
+            if withscores:
+                zset = self._zset(key)
+                return [(m, zset[m]) for m in members]
+            return members
+
+    def ztrim(self, key, size):
+        with self.lock:
+            removed = self._ranked(key)[size:]
+            self.zrem(key, *removed)
+            return len(removed)
@@ -0,0 +1,15 @@
+from celery import task
+
+from . import cascade, pages
+
+@task()
+def cascade_task(instance_label, pk, field, value):
+    """Cascades a moderation flag, see `misc.cascade`."""
+    instance = cascade.get_instance(instance_label, pk)
+    return cascade.run(instance, field, value)
+
+
+@task()
+def purge_task(scopes):
+    """Purges the pages of `scopes` from the proxy, see `misc.pages`."""
+    return pages.purge(scopes)
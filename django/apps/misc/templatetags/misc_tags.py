@@ -1,11 +1,13 @@
-import re
-
 from crispy_forms.layout import Hidden
+from django.conf import settings
+from django.core.cache.utils import make_template_fragment_key
 from django.template import Library, TemplateSyntaxError, Node, Variable
-from django.utils.html import escape, mark_safe
+from django.utils.html import mark_safe
 from django.utils.translation import ugettext as _
 
 from misc.forms import SimpleForm
+from misc.stores import get_store
+from misc.utils import format_text
 
 
 register = Library()
@@ -13,21 +15,7 @@ register = Library()
 
 @register.filter
 def format(text):
-    aux = escape(text)
-    pat = re.compile(
-        r'(^|[\n ])([\w]+?://([\w\#$%&~/.\-;:=,?@\[\]+]*))',
-        re.IGNORECASE,
-        )
-    aux = pat.sub(
-        r"\1<a class='external' href='\2' target='_blank' rel='nofollow'>\3</a>",
-        aux
-        )
-    aux = '<p>' + aux + '</p>'
-    pat = re.compile(r'(\s*\n){2,}')
-    aux = pat.sub('</p><p>', aux)
-    pat = re.compile(r'\n')
-    aux = pat.sub('<br/>', aux)
-    return mark_safe(aux)
+    return mark_safe(format_text(text))
 
 
 class ModifyPathQueryNode(Node):
@@ -41,7 +29,11 @@ class ModifyPathQueryNode(Node):
     def render(self, context):
         get = context['request'].GET.copy()
         for key, value in self.pairs.items():
-            get[key] = value.resolve(context)
+            value = value.resolve(context)
+            if value == '':
+                get.pop(key, None)  # Empty values remove the parameter.
+            else:
+                get[key] = value
         return context['request'].path + '?' + get.urlencode()
 
 
@@ -56,6 +48,42 @@ def modify_path_query(parser, token):
     return ModifyPathQueryNode(pairs)
 
 
+class CacheFragmentNode(Node):
+
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        values = [v.resolve(context) for v in self.vary_on]
+        key = 'fragments:' + make_template_fragment_key(self.name, values)
+        store = get_store()
+        html = store.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            timeout = settings.FRAGMENT_CACHE_TIMEOUT
+            store.set(key, html.encode('utf-8'), timeout=timeout)
+            return html
+        return mark_safe(html.decode('utf-8'))
+
+
+@register.tag
+def cache_fragment(parser, token):
+    """Like `cache`, in the store and for `settings.FRAGMENT_CACHE_TIMEOUT`.
+    Vary on a version that changes with whatever the fragment shows:
+    {% cache_fragment name item.pk item.version %}...{% endcache_fragment %}
+    """
+    nodelist = parser.parse(('endcache_fragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        msg = 'Tag "{}" takes at least one argument'.format(bits[0])
+        raise TemplateSyntaxError(msg)
+    vary_on = [parser.compile_filter(bit) for bit in bits[2:]]
+    return CacheFragmentNode(nodelist, bits[1], vary_on)
+
+
 @register.inclusion_tag('forms/simple.html', takes_context=True)
 def evaluation_form(context, item, evaluation):
     action = item.get_evaluate_url()
@@ -0,0 +1,407 @@
+import shutil
+import tempfile
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from cStringIO import StringIO
+from SocketServer import ThreadingMixIn
+
+from django.core.files.storage import FileSystemStorage
+from django.core.paginator import InvalidPage
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase
+from django.test.client import Client, RequestFactory
+from mock import Mock, patch
+from PIL import Image
+
+from submissions.models import Submission
+from submissions.tests import SubmissionFactory
+from users.tests import UserFactory, do_login
+from zones.models import Zone
+from zones.tests import ZoneFactory
+from . import cascade, counters, pages, thumbler
+from .paginators import CursorPaginator, encode_cursor
+
+
+class CursorPaginatorTest(TestCase):
+
+    def test_pages(self):
+        """Pages follow the ordering, ties are broken by id."""
+        submissions = [SubmissionFactory() for i in range(5)]
+        Submission.objects.update(zone_score=1)
+        queryset = Submission.objects.order_by('-zone_score')
+        paginator = CursorPaginator(queryset, 2)
+        expected = list(reversed(submissions))
+        first = paginator.page()
+        self.assertEqual(first.object_list, expected[:2])
+        self.assertFalse(first.has_previous())
+        second = paginator.page(after=first.next_cursor)
+        self.assertEqual(second.object_list, expected[2:4])
+        third = paginator.page(after=second.next_cursor)
+        self.assertEqual(third.object_list, expected[4:])
+        self.assertFalse(third.has_next())
+        back = paginator.page(before=third.previous_cursor)
+        self.assertEqual(back.object_list, expected[2:4])
+        self.assertTrue(back.has_previous())
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(Submission.objects.all(), 2)
+        self.assertRaises(InvalidPage, paginator.page, after='nonsense')
+        queryset = Submission.objects.order_by('-created')
+        paginator = CursorPaginator(queryset, 2)
+        cursor = encode_cursor(['not a date', 1])
+        self.assertRaises(InvalidPage, paginator.page, after=cursor)
+
+
+class CascadeTest(TestCase):
+
+    @patch('misc.tasks.cascade_task.delay')
+    def test_ban(self, delay):
+        """Banning rejects the submissions and votes of the user, in
+        batches, and their votes stop counting.
+        """
+        spammer = UserFactory()
+        spam = [SubmissionFactory(author=spammer) for i in range(3)]
+        submission = SubmissionFactory()
+        submission.cast_vote(spammer, 'up')
+        spammer.ban()
+        delay.assert_called_once_with('users.user', spammer.pk, 'is_rejected', True)
+        self.assertEqual(cascade.get_progress(spammer)['done'], 0)
+        self.assertEqual(cascade.run(spammer, 'is_rejected', True, 2), 7)
+        self.assertIsNone(cascade.get_progress(spammer))
+        spam = Submission.objects.filter(pk__in=[s.pk for s in spam])
+        self.assertTrue(all(s.is_rejected for s in spam))
+        submission = Submission.objects.get(pk=submission.pk)
+        self.assertEqual(submission.vote_count, 1)
+        self.assertEqual(cascade.run(spammer, 'is_rejected', True), 0)
+
+
+class CounterTest(TestCase):
+
+    def test_zone_size(self):
+        """Subscriptions change the size in place, drift is repaired."""
+        zone = ZoneFactory()
+        size = zone.size
+        user = UserFactory()
+        zone.subscribe(user)
+        zone.subscribe(user)
+        self.assertEqual(Zone.objects.get(pk=zone.pk).size, size + 1)
+        zone.unsubscribe(user)
+        self.assertEqual(Zone.objects.get(pk=zone.pk).size, size)
+        counter = counters.get_counters()['zones.zone.size']
+        self.assertEqual(list(counter.drift([zone.pk])), [])
+        Zone.objects.filter(pk=zone.pk).update(size=7)
+        [(pk, stored, expected)] = counter.drift([zone.pk])
+        counter.fix(pk, expected)
+        self.assertEqual(Zone.objects.get(pk=zone.pk).size, size)
+
+    def test_zone_size_erased_user(self):
+        """Erased users leave their zones smaller."""
+        zone = ZoneFactory()
+        user = UserFactory()
+        zone.subscribe(user)
+        user.erase()
+        counter = counters.get_counters()['zones.zone.size']
+        self.assertEqual(list(counter.drift([zone.pk])), [])
+
+
+class PageCacheTest(TestCase):
+
+    def test_anonymous_pages(self):
+        """Pages are cached until something they show changes, then a
+        single request regenerates them while the rest get the old copy.
+        """
+        client = Client()
+        submission = SubmissionFactory()
+        url = submission.get_absolute_url()
+        key = pages.page_key(url)
+        pages.get_store().delete(key, key + ':lock')
+        client.get(url)
+        with self.assertNumQueries(0):
+            response = client.get(url)
+        self.assertTrue(response.has_header('Age'))
+        submission.cast_vote(UserFactory(), 'down')
+        pages.get_store().add(key + ':lock', 1)
+        self.assertTrue(client.get(url).has_header('Age'))
+        pages.get_store().delete(key + ':lock')
+        self.assertFalse(client.get(url).has_header('Age'))
+        do_login(client, UserFactory())
+        self.assertFalse(client.get(url).has_header('Age'))
+
+    def test_votes_keep_lists(self):
+        """Votes make the submission page stale but not the lists."""
+        client = Client()
+        submission = SubmissionFactory()
+        url = reverse('submissions:global')
+        pages.get_store().delete(pages.page_key(url))
+        client.get(url)
+        submission.cast_vote(UserFactory(), 'up')
+        self.assertTrue(client.get(url).has_header('Age'))
+
+    def test_comment_count(self):
+        """New comments make the lists showing their counts stale."""
+        client = Client()
+        submission = SubmissionFactory()
+        url = reverse('submissions:global')
+        pages.get_store().delete(pages.page_key(url))
+        client.get(url)
+        self.assertTrue(client.get(url).has_header('Age'))
+        submission.increment_comment_count()
+        self.assertFalse(client.get(url).has_header('Age'))
+
+    def test_user_changed_while_rendering(self):
+        """Pages showing users aren't cached if a user changes while
+        they are rendered, their keys are only known afterwards.
+        """
+        user = UserFactory()
+        request = RequestFactory().get('/rendering/')
+        request.session = Mock(modified=False)
+        key = pages.page_key('/rendering/')
+        pages.get_store().delete(key)
+
+        def render():
+            pages.add_user_keys(request, [user])
+            pages.invalidate(u'user:{}'.format(user.username))
+            return HttpResponse('Page')
+
+        response = pages.serve(request, [], render)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIsNone(pages.get_store().get(key))
+
+    def test_purge(self):
+        """Public pages carry their surrogate keys, and their paths are
+        purged from the proxy when one of them changes.
+        """
+        PurgeHandler.paths = []
+        server = ImageServer(('127.0.0.1', 0), PurgeHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        purge_url = 'http://127.0.0.1:{}/purge'.format(server.server_port)
+        submission = SubmissionFactory()
+        url = submission.get_absolute_url()
+        pages.get_store().delete(pages.page_key(url))
+        try:
+            with self.settings(PAGE_PURGE_URL=purge_url):
+                response = Client().get(url)
+                keys = response['Surrogate-Key'].split()
+                self.assertIn('submission:' + submission.slug, keys)
+                self.assertIn('user:' + submission.author.username, keys)
+                self.assertIn('public', response['Cache-Control'])
+                purged = pages.purge(['submission:' + submission.slug])
+                # Cached copies don't record their path again.
+                Client().get(url)
+                repurged = pages.purge(['submission:' + submission.slug])
+        finally:
+            server.shutdown()
+        self.assertEqual(purged, 1)
+        self.assertEqual(repurged, 0)
+        self.assertEqual(PurgeHandler.paths, ['/purge' + url])
+
+
+class FragmentCacheTest(TestCase):
+
+    def test_versioned_fragment(self):
+        """Fragments are served from the store until the item changes."""
+        template = Template(
+            '{% load misc_tags %}'
+            '{% cache_fragment test s.pk s.version %}{{ s.title }}'
+            '{% endcache_fragment %}'
+            )
+        submission = SubmissionFactory(title='Before')
+        Submission.objects.filter(pk=submission.pk).update(title='After')
+        submission = Submission.objects.get(pk=submission.pk)
+        self.assertEqual(template.render(Context({'s': submission})), 'After')
+        submission.title = 'Changed'
+        self.assertEqual(template.render(Context({'s': submission})), 'After')
+        submission.save()
+        self.assertEqual(template.render(Context({'s': submission})), 'Changed')
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves a small image at /image.jpg, a big one without Content-Length
+    at /big.jpg and a late answer at /slow.jpg.
+    """
+    image = None
+
+    def do_GET(self):
+        if self.path == '/slow.jpg':
+            time.sleep(1)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        if self.path == '/image.jpg':
+            self.send_header('Content-Length', len(self.image))
+        self.end_headers()
+        if self.path == '/big.jpg':
+            for i in range(64):
+                self.wfile.write('\0' * 64 * 1024)
+        else:
+            self.wfile.write(self.image)
+
+    def log_message(self, *args):
+        pass
+
+
+class PurgeHandler(BaseHTTPRequestHandler):
+    """Stands for the purge location of nginx, keeps the paths requested."""
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@patch.object(thumbler, 'CONNECT_TIMEOUT', 0.5)
+@patch.object(thumbler, 'MAX_FILE_SIZE', 1000 * 1000)
+class ThumblerTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        f = StringIO()
+        Image.new('RGB', (200, 100), 'red').save(f, 'JPEG')
+        ImageHandler.image = f.getvalue()
+        cls.server = ImageServer(('127.0.0.1', 0), ImageHandler)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server.server_port, path)
+
+    def test_thumbnail(self):
+        f = StringIO()
+        timings = {}
+        thumbler.get_thumbnail(f, (110, 64), self.url('/image.jpg'), timings)
+        f.seek(0)
+        self.assertEqual(Image.open(f).size, (110, 64))
+        self.assertEqual(set(timings), {'resolve', 'download', 'decode', 'resize'})
+
+    def test_size_cap(self):
+        """Downloads stop past the limit without a Content-Length."""
+        url = self.url('/big.jpg')
+        self.assertRaises(thumbler.ThumbnailError, thumbler.download, url)
+
+    def test_timeout(self):
+        url = self.url('/slow.jpg')
+        self.assertRaises(thumbler.ThumbnailError, thumbler.download, url)
+
+    def get_thumbnail_store(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        thumbnails = thumbler.ThumbnailStore(
+            FileSystemStorage(directory), 'thumbnails', (110, 64), (1, 2))
+        sources = [self.url(p) for p in ('/image.jpg', '/image.jpg?copy')]
+        keys = [thumbnails.source_key(s) for s in sources]
+        thumbler.get_store().delete(*keys)
+        return thumbnails
+
+    def test_fetch_many(self):
+        jobs = [(1, self.url('/image.jpg')), (2, self.url('/slow.jpg'))]
+        results = thumbler.fetch_many(jobs, self.get_thumbnail_store())
+        results = dict((r.key, r) for r in results)
+        self.assertEqual(results[1].variants, [(1, 'jpeg'), (2, 'jpeg')])
+        self.assertIsNone(results[2].name)
+        self.assertTrue(results[2].error)
+
+    @patch.object(thumbler, 'download', wraps=thumbler.download)
+    @patch.object(thumbler, 'decode', wraps=thumbler.decode)
+    def test_deduplication(self, decode, download):
+        """Sources of the same image share the stored thumbnails, decoded
+        once, and sources seen before aren't even downloaded.
+        """
+        thumbnails = self.get_thumbnail_store()
+        first = thumbnails.put(self.url('/image.jpg'))
+        self.assertEqual(thumbnails.put(self.url('/image.jpg?copy')), first)
+        self.assertEqual(thumbnails.put(self.url('/image.jpg')), first)
+        self.assertTrue(thumbnails.storage.exists(first[0]))
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(download.call_count, 2)
+
+    @patch.object(thumbler, 'decode', wraps=thumbler.decode)
+    def test_force(self, decode):
+        """Forced stores render again over the stored thumbnails."""
+        thumbnails = self.get_thumbnail_store()
+        first = thumbnails.put(self.url('/image.jpg'))
+        thumbnails.force = True
+        self.assertEqual(thumbnails.put(self.url('/image.jpg')), first)
+        self.assertEqual(decode.call_count, 2)
+
+    def test_encoding_names(self):
+        """New encoding parameters give new names and source keys."""
+        thumbnails = self.get_thumbnail_store()
+        url = self.url('/image.jpg')
+        name, key = thumbnails.get_name('image'), thumbnails.source_key(url)
+        with patch.object(thumbler, 'QUALITY', 90):
+            self.assertNotEqual(thumbnails.get_name('image'), name)
+            self.assertNotEqual(thumbnails.source_key(url), key)
+
+    def test_variants(self):
+        """Every scale and format comes out of a single download."""
+        url = self.url('/image.jpg')
+        variants = thumbler.get_thumbnails((50, 20), url, (1, 2), ('jpeg', 'webp'))
+        self.assertEqual(Image.open(StringIO(variants[(2, 'jpeg')])).size, (100, 40))
+        if thumbler.is_supported('webp'):
+            self.assertEqual(Image.open(StringIO(variants[(1, 'webp')])).size, (50, 20))
+        self.assertEqual(
+            thumbler.variant_name('thumbnails/1.jpg', 2, 'webp'),
+            'thumbnails/1@2x.webp',
+            )
+
+
+class DecodeTest(SimpleTestCase):
+
+    def test_draft(self):
+        """Big JPEGs are decoded at a reduced scale that covers the size."""
+        f = StringIO()
+        Image.new('RGB', (2000, 1000), 'red').save(f, 'JPEG')
+        img = thumbler.decode(f.getvalue(), (110, 64))
+        self.assertTrue(110 <= img.size[0] < 2000)
+        self.assertTrue(64 <= img.size[1] < 1000)
+        self.assertEqual(img.mode, 'RGB')
+
+
+class ResolutionCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        sources = ['http://example.com/a', 'http://example.com/b']
+        keys = [thumbler.url_cache_key(s) for s in sources]
+        thumbler.get_store().delete(*keys)
+
+    def test_non_ascii(self):
+        """Non ASCII links have a key like the rest."""
+        source = u'http://example.com/caf\xe9?q=\xfc'
+        key = thumbler.url_cache_key(source)
+        self.assertEqual(key, thumbler.url_cache_key(source.encode('utf-8')))
+
+    @patch.object(thumbler, 'embedly')
+    def test_cached(self, embedly):
+        """Equivalent links are resolved once, also when they have none."""
+        embedly.side_effect = lambda s: 'http://example.com/a.jpg' if '/a' in s else None
+        stats = thumbler.get_url_cache_stats()
+        for source in ('http://www.Example.com/a?utm_source=x#top',
+                       'http://example.com/a',
+                       'http://example.com/b',
+                       'http://example.com/b'):
+            thumbler.get_thumbnail_url(source)
+        self.assertEqual(embedly.call_count, 2)
+        self.assertEqual(
+            thumbler.get_thumbnail_url('http://example.com/a'),
+            'http://example.com/a.jpg',
+            )
+        self.assertIsNone(thumbler.get_thumbnail_url('http://example.com/b'))
+        hits = thumbler.get_url_cache_stats()['hits'] - stats['hits']
+        self.assertEqual(hits, 4)
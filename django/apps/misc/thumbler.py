@@ -1,16 +1,34 @@
 from cStringIO import StringIO
+from httplib import HTTPException
+from multiprocessing.pool import ThreadPool
 import json
 import os
-from traceback import format_exc
+import time
+from hashlib import sha1
+from urllib import urlencode
 from urllib2 import urlopen
-from urlparse import urlparse, parse_qs
+from urlparse import urlparse, urlunparse, parse_qs, parse_qsl
 
+from django.core.files.base import ContentFile
 from embedly import Embedly
 from PIL import Image
 
+from misc.stores import get_store
+
 
 MAX_FILE_SIZE = 10 * 1000 * 1000
 FILE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+CONNECT_TIMEOUT = 5  # Seconds to connect, and to wait for every read.
+DOWNLOAD_TIMEOUT = 20  # Seconds to download the whole image.
+CHUNK_SIZE = 64 * 1024
+URL_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # Seconds resolved urls are kept.
+URL_CACHE_NEGATIVE_TIMEOUT = 60 * 60  # Seconds sources without one are kept.
+QUALITY = 75
+ENCODING_VERSION = 1  # Increase after changing how thumbnails are encoded.
+FORMATS = {  # <name, <PIL format, file extension>>
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+    }
 
 
 class ThumbnailError(Exception):
@@ -27,7 +45,7 @@ def twitter(source):
 def vimeo(source):
     vid_id = urlparse(source).path.split('/')[-1]
     info_url = 'http://vimeo.com/api/v2/video/{}.json'.format(vid_id)
-    info_json = urlopen(info_url).read().decode('utf-8')
+    info_json = urlopen(info_url, timeout=CONNECT_TIMEOUT).read().decode('utf-8')
     info = json.loads(info_json)
     return info[0].get('thumbnail_small')
 
@@ -39,11 +57,65 @@ def youtube(source):
 
 def embedly(source):
     key = os.environ['ZOONAS_EMBEDLY_KEY']
-    return Embedly(key).oembed(source).data.get('thumbnail_url')
+    client = Embedly(key, timeout=CONNECT_TIMEOUT)
+    return client.oembed(source).data.get('thumbnail_url')
+
+
+def normalize_url(source):
+    """Returns the source without the differences that don't change the
+    linked page: case of the host, www, fragments and tracking parameters.
+    Non ASCII urls come out in UTF-8, for hashing and urlencoding.
+    """
+    if isinstance(source, unicode):
+        source = source.encode('utf-8')
+    urlp = urlparse(source.strip())
+    host = (urlp.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if urlp.port and urlp.port not in (80, 443):
+        host = '{}:{}'.format(host, urlp.port)
+    query = [(k, v) for k, v in parse_qsl(urlp.query, keep_blank_values=True)
+             if not k.startswith('utm_')]
+    query = urlencode(sorted(query))
+    return urlunparse(('http', host, urlp.path or '/', urlp.params, query, ''))
+
+
+def url_cache_key(source):
+    return 'thumbler:url:' + sha1(normalize_url(source)).hexdigest()
+
+
+def cached(resolve, source):
+    """Returns `resolve(source)`, through a cache shared by all workers.
+    Sources without thumbnail are kept for a shorter time.
+    """
+    store = get_store()
+    key = url_cache_key(source)
+    url = store.get(key)
+    if url is not None:
+        store.incr('thumbler:url:hits')
+        return url or None
+    store.incr('thumbler:url:misses')
+    url = resolve(source)
+    if url:
+        store.set(key, url, timeout=URL_CACHE_TIMEOUT)
+    else:
+        store.set(key, '', timeout=URL_CACHE_NEGATIVE_TIMEOUT)
+    return url or None
+
+
+def get_url_cache_stats():
+    """Returns the hits and misses of the url cache."""
+    store = get_store()
+    return {
+        'hits': int(store.get('thumbler:url:hits') or 0),
+        'misses': int(store.get('thumbler:url:misses') or 0),
+        }
 
 
 def get_thumbnail_url(source):
-    """Returns the url of an image."""
+    """Returns the url of an image.
+    Resolving through external APIs is cached.
+    """
     urlp = urlparse(source)
     # Invalid URL
     if urlp.hostname is None:
@@ -53,24 +125,57 @@ def get_thumbnail_url(source):
         url = source
     # Known sites
     elif 'vimeo.com' in urlp.hostname:
-        url = vimeo(source)
+        url = cached(vimeo, source)
     elif 'youtube.com' in urlp.hostname or 'youtu.be' in urlp.hostname:
         url = youtube(source)
     else:
-        url = embedly(source)
+        url = cached(embedly, source)
     return url
 
 
-def get_image(source):
-    """Donwloads the image from source."""
-    resp = urlopen(source)
-    info = resp.info().getheaders('Content-Length')
-    if len(info) == 1 and int(info[0]) <= MAX_FILE_SIZE:
-        bytes = resp.read()
-        string = StringIO(bytes)
-        return Image.open(string).convert('RGB')
-    else:
-        return None
+def download(source):
+    """Returns the body at source. Gives up once it's bigger than
+    `MAX_FILE_SIZE`, with or without a Content-Length, or when it takes
+    longer than `DOWNLOAD_TIMEOUT`.
+    """
+    deadline = time.time() + DOWNLOAD_TIMEOUT
+    try:
+        resp = urlopen(source, timeout=CONNECT_TIMEOUT)
+        info = resp.info().getheaders('Content-Length')
+        if len(info) == 1 and int(info[0]) > MAX_FILE_SIZE:
+            raise ThumbnailError("Image too big.")
+        chunks = []
+        size = 0
+        while True:
+            chunk = resp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                raise ThumbnailError("Image too big.")
+            if time.time() > deadline:
+                raise ThumbnailError("Download too slow.")
+            chunks.append(chunk)
+    except (IOError, HTTPException, ValueError) as e:
+        raise ThumbnailError("Couldn't download image: {}".format(e))
+    return ''.join(chunks)
+
+
+def decode(bytes, size=None):
+    """Decodes an RGB image. Given the `size` it's going to be reduced
+    to, JPEGs are decoded in draft mode at the smallest scale that still
+    covers it, which saves most of the decoding time and memory.
+    """
+    try:
+        img = Image.open(StringIO(bytes))
+        if size is not None:
+            img.draft('RGB', size)
+        img.load()
+    except (IOError, ValueError):
+        raise ThumbnailError("Couldn't decode image.")
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
 
 
 def resize_image(img, size):
@@ -78,7 +183,7 @@ def resize_image(img, size):
     tw, th = size
     iw, ih = img.size
     scale = max(1. * tw / iw, 1. * th / ih)
-    if scale < 1:
+    if scale < 1:  # Small images are only cropped.
         iw, ih = int(iw * scale), int(ih * scale)
         img = img.resize((iw, ih), Image.ANTIALIAS)
     tw, th = min(tw, iw), min(th, ih)
@@ -87,14 +192,197 @@ def resize_image(img, size):
     return img.crop(box)
 
 
-def get_thumbnail(f, size, url):
-    """Attempts to retrieve an image from the url and generate
-    a thumbnail and save it to f.
+def is_supported(format):
+    """True when this PIL can write `format`, WebP needs libwebp."""
+    Image.init()
+    return FORMATS[format][0] in Image.SAVE
+
+
+def variant_name(name, scale, format):
+    """Returns the name of a variant of the thumbnail stored at `name`,
+    `<name>.jpg`, `<name>@2x.jpg`, `<name>.webp`, `<name>@2x.webp`...
     """
-    url = get_thumbnail_url(url)
+    base = os.path.splitext(name)[0]
+    suffix = '@{}x'.format(scale) if scale != 1 else ''
+    return base + suffix + FORMATS[format][1]
+
+
+def resolve(url, timings=None):
+    """Returns the url of the image to make thumbnails of."""
+    timings = {} if timings is None else timings
+    start = time.time()
+    try:
+        url = get_thumbnail_url(url)
+    except (IOError, HTTPException, ValueError) as e:
+        raise ThumbnailError("Couldn't resolve thumbnail: {}".format(e))
+    timings['resolve'] = time.time() - start
     if url is None:
         raise ThumbnailError("No thumbnail found.")
-    img = get_image(url)
-    if img is None:
-        raise ThumbnailError("Couldn't download image.")
-    resize_image(img, size).save(f, quality=75)
+    return url
+
+
+def render(bytes, size, scales=(1,), formats=('jpeg',), timings=None):
+    """Decodes the image once and encodes it at `size` times each of
+    `scales`, in each of `formats`. Returns a dict <<scale, format>, bytes>,
+    formats this PIL can't write are left out.
+    """
+    timings = {} if timings is None else timings
+    width, height = size
+    start = time.time()
+    img = decode(bytes, (width * max(scales), height * max(scales)))
+    timings['decode'] = time.time() - start
+    start = time.time()
+    variants = {}
+    formats = [f for f in formats if is_supported(f)]
+    for scale in scales:
+        resized = resize_image(img, (width * scale, height * scale))
+        for format in formats:
+            f = StringIO()
+            resized.save(f, FORMATS[format][0], quality=QUALITY)
+            variants[(scale, format)] = f.getvalue()
+    timings['resize'] = time.time() - start
+    return variants
+
+
+def get_thumbnails(size, url, scales=(1,), formats=('jpeg',), timings=None):
+    """Attempts to retrieve an image from the url and generate thumbnails
+    with `render`. Seconds spent in every stage are added to `timings`.
+    """
+    timings = {} if timings is None else timings
+    url = resolve(url, timings)
+    start = time.time()
+    bytes = download(url)
+    timings['download'] = time.time() - start
+    return render(bytes, size, scales, formats, timings)
+
+
+def get_thumbnail(f, size, url, timings=None):
+    """Writes a JPEG thumbnail of `size` for the url into the file `f`."""
+    f.write(get_thumbnails(size, url, timings=timings)[(1, 'jpeg')])
+
+
+class ThumbnailStore(object):
+    """Content addressed thumbnails in a django `storage`.
+    Thumbnails are named after a hash of the source image and the encoding
+    parameters, so links to the same image share the stored files, and
+    sources already seen are remembered by their resolved url to skip even
+    the download. New encoding parameters give new names. With `force`,
+    thumbnails are rendered again and overwrite the stored ones.
+    """
+
+    def __init__(self, storage, directory, size, scales=(1,), formats=('jpeg',),
+                 force=False):
+        self.storage = storage
+        self.directory = directory
+        self.size = size
+        self.scales = scales
+        self.formats = [f for f in formats if is_supported(f)]
+        self.force = force
+
+    def get_encoding(self):
+        """Everything besides the source that changes the stored files."""
+        return '{}x{}:q{}:v{}:{}:{}:'.format(
+            self.size[0],
+            self.size[1],
+            QUALITY,
+            ENCODING_VERSION,
+            ','.join(str(s) for s in self.scales),
+            ','.join(self.formats),
+            )
+
+    def get_name(self, bytes):
+        digest = sha1(self.get_encoding() + bytes).hexdigest()
+        return '{}/{}/{}.jpg'.format(self.directory, digest[:2], digest)
+
+    def source_key(self, url):
+        digest = sha1(self.get_encoding() + normalize_url(url)).hexdigest()
+        return 'thumbler:stored:' + digest
+
+    def get_variants(self, name):
+        """Returns the <scale, format> variants of `name` in storage."""
+        return [
+            (scale, format)
+            for scale in self.scales
+            for format in self.formats
+            if self.storage.exists(variant_name(name, scale, format))
+            ]
+
+    def save(self, name, data):
+        if self.force and self.storage.exists(name):
+            self.storage.delete(name)
+        if not self.storage.exists(name):
+            saved = self.storage.save(name, ContentFile(data))
+            if saved != name:  # Lost a race to an identical upload.
+                self.storage.delete(saved)
+
+    def put(self, url, timings=None):
+        """Stores the thumbnails of the image at `url`, unless they are
+        there already. Returns the name of the thumbnail and its variants.
+        """
+        timings = {} if timings is None else timings
+        url = resolve(url, timings)
+        store = get_store()
+        key = self.source_key(url)
+        stored = None if self.force else store.get(key)
+        if stored is not None:
+            name, variants = json.loads(stored)
+            return name, [tuple(v) for v in variants]
+        start = time.time()
+        bytes = download(url)
+        timings['download'] = time.time() - start
+        name = self.get_name(bytes)
+        if not self.force and self.storage.exists(name):
+            variants = self.get_variants(name)
+        else:
+            rendered = render(bytes, self.size, self.scales, self.formats, timings)
+            start = time.time()
+            # The 1x JPEG goes last, once it exists the rest do too.
+            for scale, format in sorted(rendered, reverse=True):
+                data = rendered[(scale, format)]
+                self.save(variant_name(name, scale, format), data)
+            timings['upload'] = time.time() - start
+            variants = sorted(rendered)
+        store.set(key, json.dumps([name, variants]), timeout=URL_CACHE_TIMEOUT)
+        return name, variants
+
+
+class Result(object):
+    """Outcome of a thumbnail in `fetch_many`. `name` and `variants` are
+    what `ThumbnailStore.put` returned when it worked, `error` has the
+    reason when it didn't.
+    """
+
+    def __init__(self, key, name=None, variants=None, error=None, timings=None):
+        self.key = key
+        self.name = name
+        self.variants = variants
+        self.error = error
+        self.timings = timings or {}
+
+
+def fetch(job):
+    """Stores the thumbnails of a <key, url, thumbnail store> job and
+    returns a `Result`. Only failures of the image, the network or the
+    storage end in a `Result`, anything else is a bug and raises.
+    """
+    key, url, thumbnails = job
+    timings = {}
+    try:
+        name, variants = thumbnails.put(url, timings)
+    except (ThumbnailError, EnvironmentError, HTTPException) as e:
+        return Result(key, error=unicode(e), timings=timings)
+    return Result(key, name, variants, timings=timings)
+
+
+def fetch_many(jobs, thumbnails, workers=8):
+    """Stores the thumbnails of many <key, url> `jobs` in the `thumbnails`
+    store concurrently, `workers` at a time. Yields a `Result` per job as
+    they finish.
+    """
+    jobs = [(k, u, thumbnails) for k, u in jobs]
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap_unordered(fetch, jobs):
+            yield result
+    finally:
+        pool.terminate()
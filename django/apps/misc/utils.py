@@ -1,6 +1,8 @@
 import re
 import unicodedata
 
+from django.utils.html import escape
+
 sign = lambda x : cmp(0, x)
 
 def merge_query(request, query):
@@ -21,3 +23,17 @@ def clean_slug(string):
 
 def attribute_string(dictionary):
     return ' '.join('{}="{}"'.format(k, v) for k, v in dictionary.items())
+
+FORMAT_VERSION = 1  # Increase after changing format_text, see render_notes.
+LINK_RE = re.compile(
+    r'(^|[\n ])([\w]+?://([\w\#$%&~/.\-;:=,?@\[\]+]*))',
+    re.IGNORECASE,
+    )
+LINK_HTML = r"\1<a class='external' href='\2' target='_blank' rel='nofollow'>\3</a>"
+PARAGRAPH_RE = re.compile(r'(\s*\n){2,}')
+
+def format_text(text):
+    """Escapes plain text and turns it into HTML paragraphs with links."""
+    html = LINK_RE.sub(LINK_HTML, escape(text))
+    html = '<p>' + PARAGRAPH_RE.sub('</p><p>', html) + '</p>'
+    return html.replace('\n', '<br/>')
@@ -0,0 +1,39 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from misc.utils import FORMAT_VERSION, format_text
+from notes.models import Note
+
+
+class Command(BaseCommand):
+    help = "Renders the HTML of notes rendered by older versions."
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=1000,
+            help="Notes rendered per transaction.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        queryset = Note.objects.exclude(html_version=FORMAT_VERSION).order_by('pk')
+        last = 0
+        count = 0
+        while True:
+            chunk = queryset.filter(pk__gt=last).values_list('pk', 'text')
+            rows = list(chunk[:options['chunk_size']])
+            if not rows:
+                break
+            with transaction.atomic():
+                for pk, text in rows:
+                    Note.objects.filter(pk=pk).update(
+                        html=format_text(text),
+                        html_version=FORMAT_VERSION,
+                        )
+            count += len(rows)
+            last = rows[-1][0]
+        self.stdout.write("{} notes rendered.".format(count))
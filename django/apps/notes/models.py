@@ -1,10 +1,12 @@
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.utils.html import mark_safe
 from django.utils.translation import ugettext as _
 
 from misc.fields import AutoLastModifiedField
 from misc.models import Author, Created, Erased, Private
+from misc.utils import FORMAT_VERSION, format_text
 from users.models import User
 
 
@@ -20,6 +22,14 @@ class Note(Author, Created, Erased, Private):
         editable=False,
         default=True,
         )
+    html = models.TextField(
+        editable=False,
+        blank=True,
+        )
+    html_version = models.PositiveSmallIntegerField(
+        editable=False,
+        default=0,
+        )  # Version of `format_text` that rendered `html`.
 
     class Meta:
         ordering = ['-modified']
@@ -28,8 +38,21 @@ class Note(Author, Created, Erased, Private):
         if not self.is_editable:
             return super(Note, self).save(update_fields=['is_editable'])
         else:
+            self.render()
             return super(Note, self).save(**kwargs)
 
+    def render(self):
+        self.html = format_text(self.text)
+        self.html_version = FORMAT_VERSION
+
+    def get_html(self):
+        """Returns the text as HTML, rendered when saved unless it was
+        saved by an older version of `format_text`.
+        """
+        if self.html_version != FORMAT_VERSION:
+            return mark_safe(format_text(self.text))
+        return mark_safe(self.html)
+
     def erase(self, **kwargs):
         self.text = _("Erased text.")
         self.author = User.objects.get_default()
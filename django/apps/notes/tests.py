@@ -26,6 +26,17 @@ class NoteTest(TestCase):
 
     # Models
 
+    def test_note_html(self):
+        """Notes are rendered when saved, or when shown if outdated."""
+        note = NoteFactory(text="a\n\nhttp://example.com <b>")
+        html = (
+            "<p>a</p><p><a class='external' href='http://example.com' "
+            "target='_blank' rel='nofollow'>example.com</a> &lt;b&gt;</p>"
+            )
+        self.assertEqual(note.html, html)
+        Note.objects.filter(pk=note.pk).update(html='', html_version=0)
+        self.assertEqual(Note.objects.get(pk=note.pk).get_html(), html)
+
     # Views
 
     def test_note_page(self):
@@ -6,6 +6,7 @@ from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.edit import UpdateView, FormView
 from django.views.generic.list import ListView
 
+from misc.mixins import CursorListMixin
 from notes.models import Note
 from users.decorators import admin_required_view, login_required_view
 from .models import Report
@@ -64,7 +65,7 @@ class ReportModelView(SingleObjectMixin, ReportCreateView):
 # Admin views
 
 @admin_required_view
-class ReportIndexView(ListView):
+class ReportIndexView(CursorListMixin, ListView):
     model = Report
     template_name = 'reports/index_page.html'
     paginate_by = settings.SUBMISSIONS_PER_PAGE
@@ -0,0 +1,332 @@
+import calendar
+import heapq
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.paginator import InvalidPage
+
+from misc.paginators import CursorPaginator, encode_cursor
+from misc.stores import get_store
+
+"""Ranked submission feeds materialized in sorted sets.
+For every zone, and for all zones together, the store keeps the ids of the
+top `settings.FEED_SIZE` visible submissions of each ordering in
+`SubmissionManager.ORDERING`. Visible means what anonymous users can see:
+not erased, not rejected and not private. List views page through the ids
+and fetch the submissions with a single query, anything the store can't
+answer comes from the database with cursors, see `FeedList.paginate`.
+Home feeds, the submissions of the zones a user is subscribed to, are
+merged from the zone feeds and cached for a short while.
+"""
+
+READY_KEY = 'feeds:ready'
+
+ORDERS = ('recent', 'best', 'global', 'zone')
+
+FIELDS = (
+    'pk',
+    'zone',
+    'created',
+    'value',
+    'global_score',
+    'zone_score',
+    'is_erased',
+    'is_rejected',
+    'is_private',
+    )
+
+
+def feed_key(zone, order):
+    """Returns the key of a zone feed, or of all zones when `zone` is None."""
+    return 'feeds:{}:{}'.format('all' if zone is None else zone, order)
+
+
+def home_key(subscriber, order):
+    return 'feeds:home:{}:{}'.format(subscriber, order)
+
+
+def truncated_key(key):
+    """Set when the feed at `key` has lost submissions to the size limit."""
+    return key + ':truncated'
+
+
+def member(pk):
+    """Padded so that ties sort by id, newest first."""
+    return '{:010d}'.format(pk)
+
+
+def get_score(row, order):
+    if order == 'recent':
+        created = row['created']
+        return calendar.timegm(created.utctimetuple()) + created.microsecond / 1e6
+    if order == 'best':
+        return row['value']
+    return row[order + '_score']
+
+
+def is_ready():
+    return get_store().get(READY_KEY) is not None
+
+
+def refresh(rows):
+    """Updates the feeds with `values_list(*FIELDS)` rows of submissions."""
+    added = defaultdict(dict)
+    removed = defaultdict(list)
+    for row in rows:
+        row = dict(zip(FIELDS, row))
+        visible = not (row['is_erased'] or row['is_rejected'] or row['is_private'])
+        for zone in (row['zone'], None):
+            for order in ORDERS:
+                key = feed_key(zone, order)
+                if visible:
+                    added[key][member(row['pk'])] = get_score(row, order)
+                else:
+                    removed[key].append(member(row['pk']))
+    store = get_store()
+    for key, members in removed.items():
+        store.zrem(key, *members)
+    for key, scores in added.items():
+        store.zadd(key, scores)
+        if store.ztrim(key, settings.FEED_SIZE):
+            store.set(truncated_key(key), 1)
+
+
+def update(submission, previous_zone=None):
+    """Updates the feeds of a single submission after a save. When it was
+    moved from `previous_zone`, it leaves the feeds of that zone.
+    """
+    if previous_zone is not None and previous_zone != submission.zone_id:
+        keys = [feed_key(previous_zone, order) for order in ORDERS]
+        for key in keys:
+            get_store().zrem(key, member(submission.pk))
+    attnames = {'zone': 'zone_id'}
+    refresh([[getattr(submission, attnames.get(f, f)) for f in FIELDS]])
+
+
+def rebuild(queryset, zones, chunk_size=1000):
+    """Rebuilds every feed from `queryset`. `zones` are the ids of all zones."""
+    store = get_store()
+    keys = [feed_key(z, o) for z in list(zones) + [None] for o in ORDERS]
+    store.delete(READY_KEY, *(keys + [truncated_key(k) for k in keys]))
+    queryset = queryset.filter(
+        is_erased=False,
+        is_rejected=False,
+        is_private=False,
+        ).order_by('pk')
+    last = 0
+    count = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last).values_list(*FIELDS)[:chunk_size])
+        if not rows:
+            break
+        refresh(rows)
+        count += len(rows)
+        last = rows[-1][0]
+    store.set(READY_KEY, 1)
+    return count
+
+
+class FeedPage(object):
+    """Numbered page of a feed, like `django.core.paginator.Page` without
+    counting. The last page of a truncated feed has a `next_cursor` to the
+    rest of the feed in the database.
+    """
+    previous_cursor = None
+
+    def __init__(self, object_list, number, more, next_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.more = more
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.more or self.next_cursor is not None
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class FeedPaginator(object):
+    """Pages through the stored ids of a feed, one more than a page is
+    fetched to know whether there is a next one.
+    """
+
+    def __init__(self, feed, per_page):
+        self.feed = feed
+        self.per_page = per_page
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage("Invalid page.")
+        if number < 1:
+            raise InvalidPage("Invalid page.")
+        start = (number - 1) * self.per_page
+        items = self.feed.get_slice(start, start + self.per_page + 1)
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        next_cursor = None
+        if not more and items and self.feed.is_truncated():
+            paginator = CursorPaginator(self.feed.queryset, self.per_page)
+            next_cursor = encode_cursor(paginator.get_values(items[-1]))
+        return FeedPage(items, number, more, next_cursor)
+
+
+class FeedList(object):
+    """Read only sequence of the submissions in a feed, for paginators.
+    Slices of the stored ids are fetched with a single `pk__in` query.
+    `queryset` must be the same feed sorted by the database, it serves
+    whatever the store lost to the size limit.
+    """
+
+    def __init__(self, queryset, key):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.key = key
+        self.store = get_store()
+        self.truncated = self.store.get(truncated_key(key)) is not None
+
+    def is_truncated(self):
+        return self.truncated
+
+    def count(self):
+        """The number of stored submissions."""
+        return self.store.zcard(self.key)
+
+    def get_slice(self, start, stop):
+        pks = [int(m) for m in self.store.zrevrange(self.key, start, stop - 1)]
+        return self.hydrate(pks)
+
+    def paginate(self, per_page, params):
+        """Returns a pair <paginator, page> for the request GET `params`,
+        see `misc.paginators.paginate`. Pages are numbered within the
+        store, cursors continue in the database.
+        """
+        if params.get('after') or params.get('before'):
+            paginator = CursorPaginator(self.queryset, per_page)
+            page = paginator.page(params.get('after'), params.get('before'))
+        else:
+            paginator = FeedPaginator(self, per_page)
+            page = paginator.page(params.get('page', 1))
+        return paginator, page
+
+    def hydrate(self, pks):
+        items = self.queryset.in_bulk(pks)
+        return [items[pk] for pk in pks if pk in items]
+
+
+def merge(keys, truncated, stop):
+    """K-way merge of the feeds at `keys`, returns the ids of the first
+    `stop` submissions. Stops early when a feed in `truncated` runs out,
+    since whatever follows may be missing from the store.
+    """
+    store = get_store()
+    feeds = []
+    for key in keys:
+        items = store.zrevrange(key, 0, stop - 1, withscores=True)
+        partial = key in truncated and len(items) < stop
+        feeds.append([
+            (-score, -int(m), partial and i == len(items) - 1)
+            for i, (m, score) in enumerate(items)
+            ])
+    pks = []
+    for score, pk, last in heapq.merge(*feeds):
+        pks.append(-pk)
+        if last or len(pks) == stop:
+            break
+    return pks
+
+
+class HomeFeedList(FeedList):
+    """Sequence of the submissions in the subscribed zones of a user.
+    The merged ids are cached up to the deepest page requested.
+    """
+
+    def __init__(self, queryset, subscriber, order):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.subscriber = subscriber
+        self.order = order
+        self.store = get_store()
+        self.cache_key = home_key(subscriber.pk, order)
+        cached = self.store.get(self.cache_key)
+        self.cached = json.loads(cached) if cached else None
+
+    def load(self, depth):
+        """Merges the zone feeds up to `depth` and caches the result."""
+        zones = self.subscriber.subscription_set.values_list('zone', flat=True)
+        keys = [feed_key(z, self.order) for z in zones]
+        truncated = set(k for k in keys if self.store.get(truncated_key(k)))
+        self.cached = {
+            'depth': depth,
+            'pks': merge(keys, truncated, depth),
+            'truncated': bool(truncated),
+            'count': sum(self.store.zcard(k) for k in keys),
+            }
+        self.store.set(
+            self.cache_key,
+            json.dumps(self.cached),
+            timeout=settings.HOME_FEED_TIMEOUT,
+            )
+
+    def is_truncated(self):
+        if self.cached is None:
+            self.load(settings.HOME_FEED_DEPTH)
+        return self.cached['truncated']
+
+    def count(self):
+        if self.cached is None:
+            self.load(settings.HOME_FEED_DEPTH)
+        return self.cached['count']
+
+    def get_slice(self, start, stop):
+        if self.cached is None or self.cached['depth'] < stop:
+            self.load(max(stop, settings.HOME_FEED_DEPTH))
+        return self.hydrate(self.cached['pks'][start:stop])
+
+
+def invalidate_home(subscriber):
+    """Drops the cached home feeds, after subscriptions change."""
+    get_store().delete(*[home_key(subscriber.pk, o) for o in ORDERS])
+
+
+def uses_store(user, order):
+    if user.is_superuser or user.is_authenticated() and user.is_perv:
+        return False  # They see erased or private submissions.
+    return order in ORDERS and is_ready()
+
+
+def get_list(queryset, user, order, zone=None):
+    """Returns the feed of `zone` sorted by `order` as a `FeedList`, or
+    `queryset` when the store can't serve it.
+    """
+    if not uses_store(user, order):
+        return queryset
+    return FeedList(queryset, feed_key(zone, order))
+
+
+def get_home_list(queryset, user, order, subscriber):
+    """Like `get_list` for the zones `subscriber` is subscribed to."""
+    if not uses_store(user, order):
+        return queryset
+    return HomeFeedList(queryset, subscriber, order)
@@ -4,7 +4,6 @@ from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext_lazy as _
 
 from misc.forms import SimpleModelForm
-from misc.utils import clean_slug
 from .models import Submission
 
 
@@ -22,15 +21,6 @@ class SubmissionCreateForm(SimpleModelForm):
         if user is not None:
             self.fields['zone'].queryset = user.subscribed_zone_set.all()
 
-    def clean_title(self):
-        title = self.cleaned_data.get('title')
-        aux, slug = clean_slug(title)
-        if slug == 'new':
-            raise forms.ValidationError(_("Invalid title."))
-        if Submission.objects.filter(slug__iexact=slug).exists():
-            raise forms.ValidationError(_("Title conflict."))
-        return title
-
 
 class ZoneSubmissionCreateForm(SubmissionCreateForm):
 
@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from submissions import feeds
+from submissions.models import Submission
+from zones.models import Zone
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the submission feeds in the store."
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=1000,
+            help="Submissions loaded per query.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        zones = Zone.objects.values_list('pk', flat=True)
+        count = feeds.rebuild(Submission.objects, zones, options['chunk_size'])
+        self.stdout.write("{} submissions in the feeds.".format(count))
@@ -0,0 +1,151 @@
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from submissions.models import Submission
+from submissions.tasks import thumbnails_task
+
+
+def regenerate(job):
+    """Runs in the pool, every process opens its own connection."""
+    pks, force = job
+    return pks[-1], thumbnails_task(pks, force)
+
+
+def parse_date(value):
+    try:
+        date = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise CommandError("Dates must be YYYY-MM-DD: {}".format(value))
+    return timezone.make_aware(date, timezone.get_default_timezone())
+
+
+class Command(BaseCommand):
+    help = "Regenerates the thumbnails of submissions, oldest first."
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--zone',
+            dest='zone',
+            default=None,
+            help="Only submissions of the zone with slug ZONE.",
+            ),
+        make_option(
+            '--since',
+            dest='since',
+            default=None,
+            help="Only submissions created on or after SINCE, YYYY-MM-DD.",
+            ),
+        make_option(
+            '--until',
+            dest='until',
+            default=None,
+            help="Only submissions created before UNTIL, YYYY-MM-DD.",
+            ),
+        make_option(
+            '--missing',
+            action='store_true',
+            dest='missing',
+            default=False,
+            help="Only submissions without a thumbnail.",
+            ),
+        make_option(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help="Render thumbnails again, overwriting the stored ones.",
+            ),
+        make_option(
+            '--processes',
+            type='int',
+            dest='processes',
+            default=4,
+            help="Worker processes, each fetches a batch at a time.",
+            ),
+        make_option(
+            '--batch-size',
+            type='int',
+            dest='batch_size',
+            default=50,
+            help="Submissions per batch.",
+            ),
+        make_option(
+            '--checkpoint',
+            dest='checkpoint',
+            default=None,
+            help="File with the last id done, to resume from it.",
+            ),
+        )
+
+    def get_queryset(self, options):
+        queryset = Submission.objects.order_by('pk')
+        if options['zone']:
+            queryset = queryset.filter(zone__slug=options['zone'])
+        if options['since']:
+            queryset = queryset.filter(created__gte=parse_date(options['since']))
+        if options['until']:
+            queryset = queryset.filter(created__lt=parse_date(options['until']))
+        if options['missing']:
+            queryset = queryset.filter(Q(thumbnail='') | Q(thumbnail__isnull=True))
+        return queryset
+
+    def read_checkpoint(self, path):
+        if path is None or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+
+    def write_checkpoint(self, path, pk):
+        if path is not None:
+            with open(path + '.tmp', 'w') as f:
+                f.write(str(pk))
+            os.rename(path + '.tmp', path)  # Never leaves half a number.
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        last = self.read_checkpoint(checkpoint)
+        queryset = self.get_queryset(options).filter(pk__gt=last)
+        pks = list(queryset.values_list('pk', flat=True))
+        size = options['batch_size']
+        batches = [
+            (pks[i:i + size], options['force'])
+            for i in range(0, len(pks), size)
+            ]
+        if last:
+            self.stdout.write("Resuming after submission {}.".format(last))
+        self.stdout.write("{} submissions to regenerate.".format(len(pks)))
+        connection.close()  # Not to be shared with the forked processes.
+        pool = Pool(options['processes'])
+        started = time.time()
+        count = errors = 0
+        stages = defaultdict(float)
+        try:
+            # In order, so that the checkpoint only passes finished batches.
+            for last, report in pool.imap(regenerate, batches):
+                count += report['count']
+                errors += report['errors']
+                for stage, seconds in report['stages'].items():
+                    stages[stage] += seconds
+                self.write_checkpoint(checkpoint, last)
+                elapsed = time.time() - started
+                self.stdout.write(
+                    "{}/{} done, {:.1f}/s, {:.1%} errors, last id {}.".format(
+                        count,
+                        len(pks),
+                        count / elapsed if elapsed else 0,
+                        1. * errors / count if count else 0,
+                        last,
+                        ))
+        finally:
+            pool.terminate()
+        for stage, seconds in sorted(stages.items()):
+            average = 1000 * seconds / count if count else 0
+            self.stdout.write("{}: {:.0f}ms per submission.".format(stage, average))
@@ -0,0 +1,40 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from submissions.rescoring import rescore
+
+
+class Command(BaseCommand):
+    help = "Recomputes the scores of recent submissions."
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--days',
+            type='int',
+            dest='days',
+            default=None,
+            help="Rescore submissions created in the last DAYS.",
+            ),
+        make_option(
+            '--budget',
+            type='int',
+            dest='budget',
+            default=None,
+            help="Stop after BUDGET seconds.",
+            ),
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=None,
+            help="Submissions rescored per query.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        report = rescore(
+            days=options['days'],
+            budget=options['budget'],
+            chunk_size=options['chunk_size'],
+            )
+        self.stdout.write(unicode(report))
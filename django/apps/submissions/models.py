@@ -1,16 +1,20 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext as _
 
 from domains.models import DomainName
 from comments.models import Commented
-from misc import scores
-from misc.models import Author, Created, Erased, Private, Rejected
+from misc import pages, scores, thumbler
+from misc.models import Author, Created, Erased, Private, Rejected, Versioned
+from misc.stores import get_store
 from misc.utils import clean_slug
 from users.models import User
 from votes.models import ZVote, ZVoted
 from zones.models import Zone
+from . import feeds
 from .tasks import thumbnail_task
 
 
@@ -45,15 +49,8 @@ class SubmissionManager(models.Manager):
 
     def from_subscriptions(self, subscriber, **kwargs):
         """Returns submissions from zones in the subscriber's subscriptions."""
-        # FIXME: There must be a way to avoid looping.
-        subscribed_zones = subscriber.subscribed_zone_set.all()
-        if subscribed_zones:
-            query = models.Q()
-            for zone in subscribed_zones:
-                query = query | models.Q(zone=zone)
-            return self.custom(**kwargs).filter(query)
-        else:
-            return self.none()
+        zones = subscriber.subscription_set.values_list('zone', flat=True)
+        return self.custom(**kwargs).filter(zone__in=zones)
 
 
 class SubmissionVote(ZVote):
@@ -64,7 +61,8 @@ class SubmissionVote(ZVote):
     unique_together = (('item', 'user'),)
 
 
-class Submission(Author, Created, Erased, Rejected, Private, ZVoted, Commented):
+class Submission(Author, Created, Erased, Rejected, Private, ZVoted, Commented,
+                 Versioned):
     """Submissions have a title and a link/text.
     The rest is stuff to filter, sort or display them.
     """
@@ -89,28 +87,85 @@ class Submission(Author, Created, Erased, Rejected, Private, ZVoted, Commented):
         editable=False,
         upload_to='thumbnails/submissions',
         )
+    thumbnail_variants = models.CharField(
+        blank=True,
+        editable=False,
+        max_length=50,
+        )  # Stored next to the thumbnail as "<scale>:<format> ...".
     zone = models.ForeignKey(
         verbose_name=_('zone'),
         to='zones.Zone',
         )
     objects = SubmissionManager()
 
+    def __init__(self, *args, **kwargs):
+        super(Submission, self).__init__(*args, **kwargs)
+        # The zone in the database, its feeds drop the submission on a move.
+        self.saved_zone_id = self.__dict__.get('zone_id')
+
+    RESERVED_SLUGS = ('new',)
+
     def save(self, **kwargs):
         if self.id is None:
             self.domain = DomainName.objects.obtain(self.link)
-            self.title, self.slug = clean_slug(self.title)
+            self.title, slug = clean_slug(self.title)
             self.is_rejected = self.author.is_rejected or self.domain.is_rejected
-            super(Submission, self).save(**kwargs)
+            self.insert_with_slug(slug, **kwargs)
             self.base_score = scores.base_score(self, Zone.objects.get_default())
-            self.cast_vote(user=self.author, way='up')
+            # Like `cast_vote`, with the base score in the same update.
+            self.set_vote(self.author, 1)
+            self.compute_scores()
+            super(Submission, self).save(
+                update_fields=['base_score'] + self.get_score_fields())
+            feeds.update(self)
             if (not self.is_rejected):
                 # Update exponential moving average score for current zone.
                 scores.zone_score_ewma(self.zone, self.base_score)
-                self.zone.save()
+                self.zone.save(update_fields=Zone.EWMA_FIELDS)
                 # Gnerate thumbnail.
-                thumbnail_task.delay(Submission, self.pk)
+                thumbnail_task.delay(self.pk)
         else:
             super(Submission, self).save(**kwargs)
+            feeds.update(self, self.saved_zone_id)
+        self.saved_zone_id = self.zone_id
+        update_fields = kwargs.get('update_fields')
+        if update_fields and set(update_fields) <= set(self.get_score_fields()):
+            # Votes only change the page of the submission, lists have
+            # their scores refreshed once they expire.
+            pages.invalidate('submission:{}'.format(self.slug))
+        else:
+            pages.invalidate(*self.get_page_scopes())
+
+    def get_page_scopes(self):
+        """The scopes of the cached pages showing the submission."""
+        return [
+            'all',
+            'zone:{}'.format(Zone.objects.get_slug(self.zone_id)),
+            'submission:{}'.format(self.slug),
+            ]
+
+    def insert_with_slug(self, slug, **kwargs):
+        """Inserts the submission with `slug`, or "<slug>-<n>" when it's
+        taken. Suffixes come from a counter in the store, a single atomic
+        round trip, so concurrent submissions with the same title get
+        different ones. The unique index decides, a taken suffix, like
+        after the store was flushed, only costs another try.
+        """
+        # Leaves room for "-<n>".
+        base = slug[:settings.SUBMISSION_SLUG_LENGTH - 10]
+        key = 'submissions:slug:' + base
+        self.slug = base
+        if base in self.RESERVED_SLUGS:
+            self.slug = '{}-{}'.format(base, get_store().incr(key) + 1)
+        while True:
+            try:
+                with transaction.atomic():
+                    super(Submission, self).save(**kwargs)
+                return
+            except IntegrityError:
+                if not Submission.objects.filter(slug=self.slug).exists():
+                    raise  # Not about the slug.
+            self.slug = '{}-{}'.format(base, get_store().incr(key) + 1)
 
     def erase(self):
         self.author = User.objects.get_default()
@@ -146,6 +201,10 @@ class Submission(Author, Created, Erased, Rejected, Private, ZVoted, Commented):
         self.zone_score = scores.zone_score(self)
         self.global_score = scores.global_score(self)
 
+    def get_score_fields(self):
+        fields = super(Submission, self).get_score_fields()
+        return fields + ['zone_score', 'global_score']
+
     def erase_scores(self):
         super(Submission, self).erase_scores()
         self.zone_score = 0
@@ -183,3 +242,15 @@ class Submission(Author, Created, Erased, Rejected, Private, ZVoted, Commented):
     def get_thumbnail_url(self):
         show = not self.is_erased and not self.is_rejected and self.thumbnail
         return self.thumbnail.url if show else None
+
+    def get_thumbnail_srcsets(self):
+        """Returns a dict <format, srcset> of the stored variants."""
+        if not self.get_thumbnail_url() or not self.thumbnail_variants:
+            return {}
+        storage = self.thumbnail.storage
+        srcsets = defaultdict(list)
+        for variant in self.thumbnail_variants.split():
+            scale, format = variant.split(':')
+            name = thumbler.variant_name(self.thumbnail.name, int(scale), format)
+            srcsets[format].append('{} {}x'.format(storage.url(name), scale))
+        return dict((f, ', '.join(urls)) for f, urls in srcsets.items())
@@ -0,0 +1,183 @@
+import time
+from datetime import timedelta
+
+import numpy
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from misc import scores
+from . import feeds
+from .models import Submission
+
+"""Periodic rescoring of recent submissions.
+Scores decay with time but are only computed when somebody votes, so every
+submission in the active window gets its `zone_score` and `global_score`
+recomputed here. Each chunk of submissions is loaded into numpy arrays
+and the `misc.scores` formulas are evaluated once for the whole chunk,
+with a per row fallback when a formula can't work on arrays.
+"""
+
+COLUMNS = (
+    'pk',
+    'value',
+    'base_score',
+    'zone_score',
+    'global_score',
+    'comment_count',
+    'vote_count',
+    'vote_sum',
+    'positive_count',
+    'negative_count',
+    )
+
+ZONE_COLUMNS = ('value', 'size', 'vote_ewma', 'score_ewma')
+
+FIELDS = COLUMNS + ('created',) + tuple('zone__' + c for c in ZONE_COLUMNS)
+
+
+class Columns(object):
+    """Stands in for a single item in the score formulas, every attribute
+    is an array with a value per submission.
+    """
+
+    def __init__(self, **arrays):
+        self.__dict__.update(arrays)
+
+    def seconds_since_creation(self):
+        return self.age
+
+    def is_older_than(self, seconds):
+        return self.age > seconds
+
+    def get_vote_count(self, **kwargs):
+        if kwargs:
+            raise TypeError("Filtered aggregates need the vote table.")
+        return self.vote_count
+
+    def get_value_sum(self, **kwargs):
+        if kwargs:
+            raise TypeError("Filtered aggregates need the vote table.")
+        return self.vote_sum
+
+    def get_value_avg(self, **kwargs):
+        if kwargs:
+            raise TypeError("Filtered aggregates need the vote table.")
+        count = numpy.maximum(self.vote_count, 1)
+        return numpy.where(self.vote_count > 0, self.vote_sum / count, 0)
+
+
+def load(rows, now):
+    """Builds the `Columns` of a chunk of `values_list` rows."""
+    data = dict(zip(FIELDS, zip(*rows)))
+    created = data.pop('created')
+    arrays = dict((k, numpy.array(v, dtype=float)) for k, v in data.items()
+                  if not k.startswith('zone__'))
+    arrays['pk'] = numpy.array(data['pk'], dtype=int)
+    arrays['age'] = numpy.array([(now - c).total_seconds() for c in created])
+    arrays['zone'] = Columns(**dict(
+        (c, numpy.array(data['zone__' + c], dtype=float)) for c in ZONE_COLUMNS
+        ))
+    return Columns(**arrays)
+
+
+def evaluate(columns):
+    """Returns the <zone scores, global scores> arrays for the chunk, or
+    None when the formulas don't support arrays.
+    """
+    size = len(columns.pk)
+    try:
+        with numpy.errstate(all='ignore'):
+            zone = numpy.zeros(size) + scores.zone_score(columns)
+            columns.zone_score = zone
+            glob = numpy.zeros(size) + scores.global_score(columns)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if zone.shape != (size,) or glob.shape != (size,):
+        return None
+    if not numpy.isfinite(zone).all() or not numpy.isfinite(glob).all():
+        return None
+    return zone, glob
+
+
+def evaluate_rows(pks):
+    """Per row fallback of `evaluate`, one instance at a time."""
+    submissions = Submission.objects.filter(pk__in=pks).select_related('zone')
+    submissions = dict((s.pk, s) for s in submissions)
+    zone, glob = [], []
+    for pk in pks:
+        submission = submissions[pk]
+        submission.zone_score = scores.zone_score(submission)
+        zone.append(submission.zone_score)
+        glob.append(scores.global_score(submission))
+    return numpy.array(zone), numpy.array(glob)
+
+
+def write(pks, zone, glob):
+    """Writes the new scores of a chunk in a single transaction and
+    updates the feeds.
+    """
+    table = connection.ops.quote_name(Submission._meta.db_table)
+    sql = 'UPDATE {} SET zone_score = %s, global_score = %s WHERE id = %s'
+    params = zip(zone.tolist(), glob.tolist(), pks)
+    with transaction.atomic():
+        connection.cursor().executemany(sql.format(table), params)
+    submissions = Submission.objects.filter(pk__in=pks)
+    feeds.refresh(submissions.values_list(*feeds.FIELDS))
+
+
+class Report(object):
+
+    def __init__(self):
+        self.rows = 0
+        self.vectorized = 0
+        self.chunks = 0
+        self.complete = False
+        self.started = time.time()
+        self.seconds = 0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    def __unicode__(self):
+        return (
+            u"{0.rows} submissions rescored in {0.seconds:.1f}s "
+            u"({0.rows_per_second:.0f} rows/s, {0.vectorized}/{0.chunks} "
+            u"chunks vectorized, {1})"
+            ).format(self, 'complete' if self.complete else 'out of time')
+
+
+def rescore(days=None, budget=None, chunk_size=None):
+    """Rescores submissions created in the last `days`, newest first,
+    stopping after `budget` seconds. Returns a `Report`.
+    """
+    days = days or settings.RESCORE_DAYS
+    budget = budget or settings.RESCORE_BUDGET
+    chunk_size = chunk_size or settings.RESCORE_CHUNK_SIZE
+    report = Report()
+    now = timezone.now()
+    queryset = Submission.objects.filter(
+        created__gte=now - timedelta(days=days),
+        is_erased=False,
+        ).order_by('-pk')
+    last = None
+    while time.time() - report.started < budget:
+        chunk = queryset if last is None else queryset.filter(pk__lt=last)
+        rows = list(chunk.values_list(*FIELDS)[:chunk_size])
+        if not rows:
+            report.complete = True
+            break
+        columns = load(rows, now)
+        pks = columns.pk.tolist()
+        result = evaluate(columns)
+        if result is None:
+            result = evaluate_rows(pks)
+        else:
+            report.vectorized += 1
+        write(pks, *result)
+        report.rows += len(rows)
+        report.chunks += 1
+        last = pks[-1]
+    report.seconds = time.time() - report.started
+    return report
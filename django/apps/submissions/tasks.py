@@ -1,28 +1,76 @@
-import os
+from collections import defaultdict
 
 from celery import task
 from django.conf import settings
-from django.core import files
 
 from misc import thumbler
 
+
+def get_thumbnail_store(model, force=False):
+    """Returns the `thumbler.ThumbnailStore` of the submission thumbnails."""
+    field = model._meta.get_field('thumbnail')
+    return thumbler.ThumbnailStore(
+        field.storage,
+        field.upload_to,
+        settings.THUMBNAIL_SIZE,
+        settings.THUMBNAIL_SCALES,
+        settings.THUMBNAIL_FORMATS,
+        force,
+        )
+
+
+def save_thumbnail(submission, result):
+    """Assigns the thumbnail of a `thumbler.Result` to the submission, or
+    the zone thumbnail when there is none.
+    """
+    if result.name is None:
+        submission.thumbnail = submission.zone.thumbnail
+        submission.thumbnail_variants = ''
+    else:
+        submission.thumbnail = result.name
+        submission.thumbnail_variants = ' '.join(
+            '{}:{}'.format(*v) for v in result.variants
+            )
+    submission.save(update_fields=['thumbnail', 'thumbnail_variants'])
+
+
 @task()
-def thumbnail_task(model, pk):
+def thumbnail_task(pk):
     """Takes the submission link, finds an image and generates
-    a thumbnail, then assigns that thumbnail to the submission.
+    thumbnails, then assigns them to the submission.
+    Submissions of the same image share the stored thumbnails.
     """
-    query = model.objects.filter(pk=pk)
+    from .models import Submission
+    query = Submission.objects.filter(pk=pk)
     if query.exists():
         submission = query.get()
-        try:
-            path = '/tmp/{}.jpg'.format(pk)
-            f = files.File(open(path, 'w+'))
-            thumbler.get_thumbnail(f, settings.THUMBNAIL_SIZE, submission.link)
-        except thumbler.ThumbnailError:
-            submission.thumbnail = submission.zone.thumbnail
-            submission.save(update_fields=['thumbnail'])
-        else:
-            submission.thumbnail = f
-            submission.save(update_fields=['thumbnail'])  # django-storages takes care of uploading
-        finally:
-            os.remove(path)
+        job = (pk, submission.link, get_thumbnail_store(Submission))
+        save_thumbnail(submission, thumbler.fetch(job))
+
+
+@task()
+def thumbnails_task(pks, force=False):
+    """Generates the thumbnails of many submissions concurrently, over the
+    stored ones with `force`. Returns the failures and the seconds spent in
+    every stage, summed.
+    """
+    from .models import Submission
+    submissions = Submission.objects.select_related('zone').in_bulk(pks)
+    jobs = [(pk, s.link) for pk, s in submissions.items()]
+    stages = defaultdict(float)
+    errors = 0
+    thumbnails = get_thumbnail_store(Submission, force)
+    results = thumbler.fetch_many(jobs, thumbnails)
+    for result in results:
+        save_thumbnail(submissions[result.key], result)
+        errors += result.name is None
+        for stage, seconds in result.timings.items():
+            stages[stage] += seconds
+    return {'count': len(jobs), 'errors': errors, 'stages': dict(stages)}
+
+
+@task()
+def rescore_task():
+    """Recomputes the time dependent scores of recent submissions."""
+    from .rescoring import rescore
+    return unicode(rescore())
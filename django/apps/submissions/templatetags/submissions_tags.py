@@ -10,9 +10,15 @@ register = Library()
 
 @register.inclusion_tag('submissions/thumbnail.html')
 def show_thumbnail(submission):
-    """Displays a thumbnail image inside a div."""
-    url = submission.get_thumbnail_url()
-    return dict(thumbnail=url, link=submission.link, alt=submission.title)
+    """Displays a thumbnail image inside a div, with the stored variants
+    in `srcset` for high density screens and browsers that take WebP.
+    """
+    return dict(
+        thumbnail=submission.get_thumbnail_url(),
+        srcsets=submission.get_thumbnail_srcsets(),
+        link=submission.link,
+        alt=submission.title,
+        )
 
 
 @register.filter
@@ -1,11 +1,16 @@
 import factory
+from datetime import timedelta
 
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
 
+from comments.models import Comment
+from notes.models import Note
 from users.tests import UserFactory, do_login
+from zones.models import Zone
 from zones.tests import ZoneFactory
+from . import feeds, rescoring
 from .models import Submission
 
 
@@ -31,6 +36,16 @@ class SimpleTest(TestCase):
         b = SubmissionFactory(link="http://www.az.org:80/about/")
         self.assertEqual(a.domain, b.domain)
 
+    def test_submission_slug_suffix(self):
+        """Check titles already taken get a numbered slug.
+        """
+        a = SubmissionFactory(title="Same Title")
+        b = SubmissionFactory(title="same title")
+        new = SubmissionFactory(title="New")
+        self.assertEqual(a.slug, 'same-title')
+        self.assertTrue(b.slug.startswith('same-title-'))
+        self.assertTrue(new.slug.startswith('new-'))
+
     def test_submission_erase(self):
         """Check that erasing a submission removes the title and
         sets scores to 0.
@@ -297,6 +312,113 @@ class SimpleTest(TestCase):
         self.assertEqual(resp.status_code, 200)
 
 
+class CommentTreeTest(TestCase):
+
+    def comment(self, item, parent=None):
+        note = Note.objects.create(text="Text.", author=item.author)
+        comment = Comment(note=note, item=item, parent=parent)
+        comment.save()
+        return comment
+
+    def test_thread_order(self):
+        """Replies follow their parent, in a single query."""
+        submission = SubmissionFactory()
+        a = self.comment(submission)
+        b = self.comment(submission)
+        c = self.comment(submission, parent=a)
+        d = self.comment(submission, parent=c)
+        e = self.comment(submission, parent=a)
+        with self.assertNumQueries(1):
+            comments = Comment.objects.tree(submission)
+        self.assertEqual(comments, [a, c, d, e, b])
+        self.assertEqual(comments[0].replies, [c, e])
+        self.assertEqual(comments[2].depth, 2)
+
+
+class RescoreTest(TestCase):
+
+    def test_rescore_recent(self):
+        """Only submissions in the window are rescored."""
+        SubmissionFactory()
+        old = SubmissionFactory()
+        created = old.created - timedelta(days=30)
+        Submission.objects.filter(pk=old.pk).update(created=created)
+        report = rescoring.rescore(days=7, budget=60)
+        self.assertTrue(report.complete)
+        self.assertEqual(report.rows, 1)
+
+
+class FeedTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+
+    def tearDown(self):
+        feeds.get_store().delete(feeds.READY_KEY)
+
+    def rebuild(self):
+        zones = Zone.objects.values_list('pk', flat=True)
+        feeds.rebuild(Submission.objects, zones)
+
+    def test_feed_index(self):
+        """The index pages through the stored feed."""
+        a = SubmissionFactory()
+        b = SubmissionFactory()
+        self.rebuild()
+        response = self.client.get(reverse('submissions:global') + '?sort=recent')
+        self.assertIsInstance(response.context['object_list'], feeds.FeedList)
+        self.assertEqual(list(response.context['submission_list']), [b, a])
+
+    def test_truncated_feed(self):
+        """Pages past a truncated feed continue in the database, and no
+        page counts the submissions.
+        """
+        a, b, c = [SubmissionFactory() for i in range(3)]
+        with self.settings(FEED_SIZE=2):
+            self.rebuild()
+        feed = feeds.get_list(Submission.objects.order_by('-created'),
+                              UserFactory(), 'recent')
+        with self.assertNumQueries(1):
+            paginator, page = feed.paginate(2, {})
+        self.assertEqual(list(page), [c, b])
+        self.assertTrue(page.has_next())
+        paginator, page = feed.paginate(2, {'after': page.next_cursor})
+        self.assertEqual(list(page), [a])
+
+    def test_feed_updates(self):
+        """Rejected submissions leave the feeds."""
+        submission = SubmissionFactory()
+        self.rebuild()
+        submission.reject()
+        response = self.client.get(submission.zone.get_absolute_url())
+        self.assertNotContains(response, submission.title)
+
+    def test_feed_erased(self):
+        """Erased submissions leave the feeds of their zone."""
+        submission = SubmissionFactory()
+        zone = submission.zone
+        self.rebuild()
+        submission.erase()
+        key = feeds.feed_key(zone.pk, 'recent')
+        self.assertEqual(feeds.get_store().zcard(key), 0)
+
+    def test_home_feed(self):
+        """The home feed merges the subscribed zones, newest first."""
+        user = UserFactory()
+        zone = ZoneFactory()
+        a = SubmissionFactory(zone=zone)
+        b = SubmissionFactory()
+        c = SubmissionFactory(zone=zone)
+        self.rebuild()
+        zone.subscribe(user)
+        do_login(self.client, user)
+        response = self.client.get(reverse('frontpage') + '?sort=recent')
+        self.assertEqual(list(response.context['submission_list']), [c, a])
+        b.zone.subscribe(user)  # Drops the cached feed.
+        response = self.client.get(reverse('frontpage') + '?sort=recent')
+        self.assertEqual(list(response.context['submission_list']), [c, b, a])
+
+
 #     def test_submit_user_200_missing_data(self):
 #         response = self.c.post(reverse('account:login'), user_data)
 #         response = self.c.post(reverse('submissions:create'), sub_data_missing)
@@ -8,14 +8,18 @@ from django.views.generic.detail import DetailView, SingleObjectMixin
 from django.views.generic.edit import CreateView, UpdateView, ProcessFormView
 from django.views.generic.list import ListView
 
+from comments.models import Comment
 from comments.views import CommentCreateView
-from misc.decorators import author_required_view
-from misc.mixins import NavigationMixin, OrderedMixin
+from misc import pages
+from misc.decorators import anonymous_cache_view, author_required_view
+from misc.mixins import CursorListMixin, NavigationMixin, OrderedMixin
 from reports.views import ReportModelView
 from users.decorators import login_required_view
+from votes.models import prefetch_votes
 from votes.views import VoteView
 from zones.decorators import moderator_required_view
 from zones.mixins import ZoneMixin
+from . import feeds
 from .decorators import author_or_moderator_required_view
 from .models import Submission
 from .forms import (
@@ -27,6 +31,7 @@ from .forms import (
 
 # Public views
 
+@anonymous_cache_view('submission:{slug}')
 class SubmissionMainView(ZoneMixin, DetailView):
     """Displays a single Submission details and options."""
     model = Submission
@@ -41,10 +46,15 @@ class SubmissionMainView(ZoneMixin, DetailView):
         comment_form = CommentCreateView.form_class
         comment_url = self.object.get_comment_url()
         context['comment_form'] = comment_form(action=comment_url)
+        comments = Comment.objects.tree(self.object)
+        context['comment_list'] = prefetch_votes(comments, self.request.user)
+        authors = [self.object.author] + [c.note.author for c in comments]
+        pages.add_user_keys(self.request, authors)
         return context
 
 
-class SubmissionListView(NavigationMixin, OrderedMixin, ListView):
+@anonymous_cache_view('all')
+class SubmissionListView(NavigationMixin, OrderedMixin, CursorListMixin, ListView):
     """Lists all submissions."""
     model = Submission
     template_name = 'submissions/index_page.html'
@@ -52,12 +62,13 @@ class SubmissionListView(NavigationMixin, OrderedMixin, ListView):
     default_order = 'global'
 
     def get_queryset(self):
+        order = self.get_order()
         submissions = Submission.objects.custom(
             user=self.request.user,
-            order=self.get_order(),
+            order=order,
             is_rejected=False,
         ).select_related('zone', 'author')
-        return submissions
+        return feeds.get_list(submissions, self.request.user, order)
 
     def get_action(self):
         return (_("Share"), reverse('submissions:create'))
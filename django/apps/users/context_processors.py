@@ -1,7 +1,9 @@
+from zones.navigation import get_subscribed_zones, lazy
 
 
 def subscribed_zone_list(request):
     if request.user.is_authenticated():
-        return {'subscribed_zone_list': request.user.subscribed_zone_set.all()}
+        zones = lazy(get_subscribed_zones, request.user)
+        return {'subscribed_zone_list': zones}
     else:
         return {}
@@ -3,6 +3,7 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
+from django.db.models import Q
 from django.utils.translation import ugettext as _
 
 from .models import User
@@ -35,7 +36,10 @@ class RegisterForm(forms.Form):
 
     def clean_username(self):
         username = self.cleaned_data['username']
-        if User.objects.filter(username__iexact=username).exists():
+        key = username.lower()
+        # Usernames without a key yet, until fill_username_keys has run.
+        unfilled = Q(username_key__isnull=True, username__iexact=username)
+        if User.objects.filter(Q(username_key=key) | unfilled).exists():
             raise forms.ValidationError(_("Username already used."))
         return username
 
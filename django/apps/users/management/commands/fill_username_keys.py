@@ -0,0 +1,63 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection, transaction
+
+from users.models import User
+
+
+def fill(pks):
+    """Sets the username keys of the users in `pks` in a single update."""
+    meta = User._meta
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = LOWER({}) WHERE {} IN %s'.format(
+        quote(meta.db_table),
+        quote(meta.get_field('username_key').column),
+        quote(meta.get_field('username').column),
+        quote(meta.pk.column),
+        )
+    connection.cursor().execute(sql, [tuple(pks)])
+
+
+class Command(BaseCommand):
+    help = ("Fills the lower case username keys of users saved before the "
+            "column existed, reports usernames that only differ in case.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=10000,
+            help="Users updated per transaction.",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        queryset = User.objects.filter(username_key__isnull=True).order_by('pk')
+        last = 0
+        count = 0
+        duplicates = []
+        while True:
+            chunk = queryset.filter(pk__gt=last).values_list('pk', flat=True)
+            pks = list(chunk[:options['chunk_size']])
+            if not pks:
+                break
+            try:
+                with transaction.atomic():
+                    fill(pks)
+                count += len(pks)
+            except IntegrityError:
+                # One at a time to find the duplicates, they're left empty.
+                for pk in pks:
+                    try:
+                        with transaction.atomic():
+                            fill([pk])
+                        count += 1
+                    except IntegrityError:
+                        duplicates.append(pk)
+            last = pks[-1]
+        for pk in duplicates:
+            username = User.objects.get(pk=pk).username
+            self.stdout.write(
+                "User {} {}: username taken in other case.".format(pk, username))
+        self.stdout.write("{} username keys filled.".format(count))
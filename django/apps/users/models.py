@@ -7,8 +7,11 @@ from django.core.urlresolvers import reverse
 from django.db import models
 from django.utils.translation import ugettext as _
 
+from misc import cascade, pages
 from misc.models import Rejected, Erased
 from misc.fields import AutoCreatedField
+from misc.stores import get_store
+from zones.membership import invalidate
 
 
 class UserManager(BaseUserManager):
@@ -29,13 +32,27 @@ class UserManager(BaseUserManager):
         l = settings.USER_NAME_LENGTH
         generate = lambda : ''.join(random.sample(string.ascii_lowercase, l))
         r = generate()
-        while self.filter(username=r).exists():
+        while self.filter(username_key=r).exists():
             r = generate()
         return r
 
     def get_default(self):
         return self.get(pk=1)
 
+    ACTIVE_COUNT_KEY = 'users:active_count'
+
+    def refresh_active_count(self):
+        """Counts the active users and keeps the result in the store."""
+        count = self.filter(is_active=True).count()
+        timeout = settings.ACTIVE_USER_COUNT_TIMEOUT
+        get_store().set(self.ACTIVE_COUNT_KEY, count, timeout=timeout)
+        return count
+
+    def active_count(self):
+        """Returns the stored count of active users, may be a bit old."""
+        count = get_store().get(self.ACTIVE_COUNT_KEY)
+        return int(count) if count is not None else self.refresh_active_count()
+
 
 class User(AbstractBaseUser, Rejected, Erased):
     USERNAME_FIELD = 'username'
@@ -44,6 +61,12 @@ class User(AbstractBaseUser, Rejected, Erased):
         max_length=settings.USER_NAME_LENGTH,
         db_index=True,
         )
+    username_key = models.CharField(
+        editable=False,
+        unique=True,
+        null=True,
+        max_length=settings.USER_NAME_LENGTH,
+        )  # The lower case username, for case insensitive checks.
     is_active = models.BooleanField(
         editable=False,
         default=True,
@@ -66,6 +89,18 @@ class User(AbstractBaseUser, Rejected, Erased):
     class Meta:
         ordering = ['username']
 
+    def save(self, **kwargs):
+        key = self.username.lower()
+        if key != self.username_key:
+            # Users that only differ in case from an older one keep no key.
+            others = User.objects.exclude(pk=self.pk)
+            taken = others.filter(username_key=key).exists()
+            self.username_key = None if taken else key
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'username' in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['username_key']
+        super(User, self).save(**kwargs)
+
     def set_perv(self, is_perv):
         self.is_perv = is_perv
         self.save()
@@ -86,16 +121,23 @@ class User(AbstractBaseUser, Rejected, Erased):
         return self.subscription_set.count()
 
     def erase(self):
+        username = self.username
         self.username = User.objects.random_username()
-        self.subscribed_zone_set.clear()
+        for zone in self.subscribed_zone_set.all():
+            zone.unsubscribe(self)  # Keeps the zone sizes.
         self.moderated_zone_set.clear()
+        invalidate(self)
         self.is_active = False
         super(User, self).erase()
+        # Once the new username is saved, so pages rendered meanwhile go too.
+        pages.invalidate(u'user:{}'.format(username))
 
     def ban(self):
         self.moderated_zone_set.clear()
+        invalidate(self)
         self.is_active = False
         super(User, self).reject()
+        cascade.start(self, 'is_rejected', True)
 
     def __unicode__(self):
         return self.username
@@ -4,6 +4,7 @@ from django.test import TestCase
 from django.test.client import Client
 from django.utils.translation import ugettext as _
 
+from .forms import RegisterForm
 from .models import User
 
 
@@ -37,6 +38,28 @@ class UserTest(TestCase):
         self.assertNotEqual(user.username, previous_username)
         self.assertEqual(user.get_public_name(), _("Erased user"))
 
+    def test_username_key(self):
+        """Check the username key follows the username in lower case.
+        """
+        user = UserFactory(username='MixedCase')
+        self.assertEqual(user.username_key, 'mixedcase')
+        user.erase()
+        self.assertEqual(user.username_key, user.username.lower())
+
+    def test_username_key_duplicates(self):
+        """Check users that only differ in case from one with the key
+        can still be saved, and that their usernames aren't available.
+        """
+        user = UserFactory(username='Twice')
+        User.objects.filter(pk=user.pk).update(username_key=None)
+        other = UserFactory(username='twice')
+        user.save()
+        self.assertIsNone(user.username_key)
+        self.assertEqual(other.username_key, 'twice')
+        other.delete()
+        form = RegisterForm({'username': 'TWICE'})
+        self.assertIn('username', form.errors)
+
     def test_ban(self):
         """Check that the banned user can't log in."""
         user = UserFactory()
@@ -12,6 +12,7 @@ from django.views.generic.list import ListView
 
 from misc.mixins import OrderedItemListMixin, NavigationMixin
 from reports.views import ReportModelView
+from submissions import feeds
 from submissions.models import Submission
 from .decorators import admin_required_view, login_required_view
 from .forms import RegisterForm, LoginForm, EraseForm, PasswordForm
@@ -67,7 +68,8 @@ class ProfileSubscribedView(OrderedItemListMixin, ProfileBaseView):
             subscriber=self.object,
             is_rejected=False,
             ).select_related('zone', 'author')
-        return submissions
+        user = self.request.user
+        return feeds.get_home_list(submissions, user, order, self.object)
 
 
 class ProfileSubmittedView(ProfileSubscribedView):
@@ -155,7 +157,8 @@ class AccountSubscribedView(NavigationMixin, OrderedItemListMixin, TemplateView)
             subscriber=self.request.user,
             is_rejected=False,
             ).select_related('zone', 'author')
-        return submissions
+        user = self.request.user
+        return feeds.get_home_list(submissions, user, order, user)
 
     def get_action(self):
         return (
@@ -0,0 +1,58 @@
+from django.db.models import Count, Sum, get_models
+
+from .models import Voted
+
+"""Recomputes the vote aggregates stored in `Voted` items from the vote
+tables, to catch and repair drift.
+"""
+
+
+def voted_models():
+    """Returns every concrete model with votes."""
+    return [m for m in get_models() if issubclass(m, Voted)]
+
+
+def recompute(model, pks):
+    """Returns a dict of <pk, aggregates> for the items in `pks`.
+    Rejected votes don't count.
+    """
+    result = dict((pk, dict.fromkeys(Voted.AGGREGATE_FIELDS, 0)) for pk in pks)
+    votes = model.vote_through.objects.filter(item__in=pks, is_rejected=False)
+    rows = votes.values('item').annotate(count=Count('id'), total=Sum('value'))
+    for row in rows:
+        result[row['item']]['vote_count'] = row['count']
+        result[row['item']]['vote_sum'] = row['total'] or 0
+    lookups = (('positive_count', 'value__gt'), ('negative_count', 'value__lt'))
+    for name, lookup in lookups:
+        rows = votes.filter(**{lookup: 0}).values('item').annotate(Count('id'))
+        for row in rows:
+            result[row['item']][name] = row['id__count']
+    return result
+
+
+def differ(stored, expected):
+    return any(abs(stored[k] - expected[k]) > 1e-6 for k in expected)
+
+
+def drift(model, chunk_size=1000):
+    """Yields <pk, stored, expected> for every item of `model` whose stored
+    aggregates don't match its votes. Items are checked in chunks.
+    """
+    fields = Voted.AGGREGATE_FIELDS
+    queryset = model._default_manager.order_by('pk')
+    last = 0
+    while True:
+        chunk = queryset.filter(pk__gt=last).values_list('pk', *fields)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            break
+        expected = recompute(model, [row[0] for row in rows])
+        for row in rows:
+            stored = dict(zip(fields, row[1:]))
+            if differ(stored, expected[row[0]]):
+                yield row[0], stored, expected[row[0]]
+        last = rows[-1][0]
+
+
+def fix(model, pk, expected):
+    model._default_manager.filter(pk=pk).update(**expected)
@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import get_model
+
+from misc.stores import get_store
+
+"""Write-behind buffer for vote rescoring.
+With `settings.VOTE_BUFFERING` the vote row is written during the request
+but the voted item is only marked as pending. A flush, scheduled at most
+once per `settings.VOTE_BUFFER_WINDOW` seconds, recomputes the scores of
+every pending item once, no matter how many votes it got in the meantime.
+"""
+
+PENDING_KEY = 'votes:pending'
+SCHEDULED_KEY = 'votes:scheduled'
+
+
+def item_key(item):
+    meta = item._meta
+    return '{}.{}:{}'.format(meta.app_label, meta.object_name.lower(), item.pk)
+
+
+def add(item):
+    """Marks `item` as pending and schedules a flush if there isn't one."""
+    store = get_store()
+    store.sadd(PENDING_KEY, item_key(item))
+    window = settings.VOTE_BUFFER_WINDOW
+    if store.add(SCHEDULED_KEY, 1, timeout=window):
+        from .tasks import flush_votes_task
+        flush_votes_task.apply_async(countdown=window)
+
+
+def pending():
+    """Drains the pending items, returns a dict of <model, set of pks>."""
+    grouped = defaultdict(set)
+    for key in get_store().drain(PENDING_KEY):
+        label, pk = key.rsplit(':', 1)
+        model = get_model(*label.split('.'))
+        if model is not None:
+            grouped[model].add(int(pk))
+    return grouped
+
+
+def flush():
+    """Recomputes the scores of every pending item. Returns the number of
+    items that were rescored.
+    """
+    store = get_store()
+    # Votes arriving from now on schedule their own flush.
+    store.delete(SCHEDULED_KEY)
+    count = 0
+    for model, pks in pending().items():
+        for item in model.objects.filter(pk__in=pks):
+            item.compute_scores()
+            item.save(update_fields=item.get_score_fields())
+            count += 1
+    return count
@@ -1,8 +1,11 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.db import models
-from django.db.models import Sum, Avg, Count
+from django.db.models import F, Sum, Avg, Count
 
 from misc import scores
-from misc.models import Private, Rejected
+from misc.models import Private, Rejected, skip_fields
 
 """This contains common code for the voting functionality.
 It avoids the use of Django generic relationships and ignores most of
@@ -63,28 +66,77 @@ class Voted(models.Model):
     """Implements vote functionality. Any concrete subclass must declare:
     `vote_through`: the vote model, must inherit from Vote.
     `voter_set`: a ManyToManyField to User, with through=vote_through.
+    Set `vote_buffering` to False to always rescore during the request.
+    The vote aggregates are running totals over all the item's votes.
     """
+    AGGREGATE_FIELDS = ('vote_count', 'vote_sum', 'positive_count',
+                        'negative_count')
     value_function = scores.value
+    vote_buffering = True
     value = models.FloatField(
         default=0,
         editable=False,
         )
+    vote_count = models.IntegerField(
+        default=0,
+        editable=False,
+        )
+    vote_sum = models.FloatField(
+        default=0,
+        editable=False,
+        )
+    positive_count = models.IntegerField(
+        default=0,
+        editable=False,
+        )
+    negative_count = models.IntegerField(
+        default=0,
+        editable=False,
+        )
 
     class Meta:
         abstract = True
 
+    def save(self, **kwargs):
+        """Aggregates are only written by `update_vote_aggregates`, saving
+        an outdated instance must not undo concurrent votes.
+        """
+        skip_fields(self, kwargs, Voted.AGGREGATE_FIELDS)
+        super(Voted, self).save(**kwargs)
+
     @property
     def display_value(self):
         return round(self.value * 5)
 
+    def update_vote_aggregates(self, previous, current, created):
+        """Applies the change of a single vote from `previous` to `current`
+        value. The row is updated atomically, the instance is updated too.
+        """
+        changes = {
+            'vote_count': 1 if created else 0,
+            'vote_sum': current - previous,
+            'positive_count': (current > 0) - (previous > 0),
+            'negative_count': (current < 0) - (previous < 0),
+            }
+        changes = dict((k, v) for k, v in changes.items() if v != 0)
+        if changes:
+            updates = dict((k, F(k) + v) for k, v in changes.items())
+            type(self)._default_manager.filter(pk=self.pk).update(**updates)
+            for name, delta in changes.items():
+                setattr(self, name, getattr(self, name) + delta)
+
     def set_vote(self, user, value):
         model = self.vote_through
         vote, created = model.objects.get_or_create(item=self, user=user)
+        previous = vote.value
         if vote.value > 0 and value > 0 or vote.value < 0 and value < 1:
             vote.value = 0
         else:
             vote.value = value - user.vote_ewma / 2.0
         vote.save()
+        self._prefetched_vote = (user.pk, vote)
+        if not vote.is_rejected:  # Rejected votes don't count.
+            self.update_vote_aggregates(previous, vote.value, created)
         if created:
             scores.user_vote_ewma(user, value)
             user.save()
@@ -93,36 +145,66 @@ class Voted(models.Model):
     def cast_vote(self, user, way):
         vote = self.set_vote(user, 1 if way == 'up' else -1)[0]
         self.compute_scores()
-        self.save()
+        self.save(update_fields=self.get_score_fields())
+        return vote
+
+    def buffer_vote(self, user, way):
+        """Like `cast_vote`, but leaves rescoring to the vote buffer when
+        `settings.VOTE_BUFFERING` is enabled.
+        """
+        if not settings.VOTE_BUFFERING or not self.vote_buffering:
+            return self.cast_vote(user, way)
+        from . import buffer
+        vote = self.set_vote(user, 1 if way == 'up' else -1)[0]
+        buffer.add(self)
         return vote
 
     def get_vote(self, user):
-        query = self.vote_through.objects.filter(item=self, user=user)
-        return query.get() if query.exists() else None
+        prefetched = getattr(self, '_prefetched_vote', None)
+        if prefetched is not None and prefetched[0] == user.pk:
+            return prefetched[1]
+        return self.vote_through.objects.filter(item=self, user=user).first()
 
     def get_votes(self):
         votes = self.vote_through.objects.filter(item=self, is_private=False)
         votes = votes.select_related('user')
         return votes
 
+    # Without filters the aggregates come from the item's own columns.
+    # Like them, filtered aggregates leave out rejected votes.
+
+    def get_counted_votes(self, **kwargs):
+        kwargs.setdefault('is_rejected', False)
+        return self.vote_through.objects.filter(item=self, **kwargs)
+
     def get_vote_count(self, **kwargs):
-        votes = self.vote_through.objects.filter(item=self, **kwargs)
+        if not kwargs:
+            return self.vote_count
+        votes = self.get_counted_votes(**kwargs)
         total = votes.aggregate(Count('value'))['value__count']
         return 0 if total is None else total
 
     def get_value_avg(self, **kwargs):
-        votes = self.vote_through.objects.filter(item=self, **kwargs)
+        if not kwargs:
+            return self.vote_sum / self.vote_count if self.vote_count else 0
+        votes = self.get_counted_votes(**kwargs)
         total = votes.aggregate(Avg('value'))['value__avg']
         return 0 if total is None else total
 
     def get_value_sum(self, **kwargs):
-        votes = self.vote_through.objects.filter(item=self, **kwargs)
+        if not kwargs:
+            return self.vote_sum
+        votes = self.get_counted_votes(**kwargs)
         total = votes.aggregate(Sum('value'))['value__sum']
         return 0 if total is None else total
 
     def compute_scores(self):
         self.value = self.value_function()
 
+    def get_score_fields(self):
+        """Fields written by `compute_scores`."""
+        return ['value']
+
     def erase_scores(self):
         self.value = 0
 
@@ -137,6 +219,24 @@ class ZVoted(Voted):
         vote, created = super(ZVoted, self).set_vote(user, value)
         if created:
             scores.zone_vote_ewma(self.zone, value)
-            self.zone.save()
+            self.zone.save(update_fields=self.zone.EWMA_FIELDS)
         return vote, created
 
+
+def prefetch_votes(items, user):
+    """Loads the votes of `user` on every voted item in `items`, with a
+    query per vote model, so that `get_vote` doesn't query. Returns `items`.
+    """
+    if not user.is_authenticated():
+        return items
+    voted = defaultdict(list)
+    for item in items:
+        if isinstance(item, Voted):
+            voted[item.vote_through].append(item)
+    for vote_model, vote_items in voted.items():
+        pks = [item.pk for item in vote_items]
+        votes = vote_model.objects.filter(user=user, item__in=pks)
+        votes = dict((vote.item_id, vote) for vote in votes)
+        for item in vote_items:
+            item._prefetched_vote = (user.pk, votes.get(item.pk))
+    return items
@@ -0,0 +1,8 @@
+from celery import task
+
+from . import buffer
+
+@task()
+def flush_votes_task():
+    """Rescores the items that got votes since the last flush."""
+    return buffer.flush()
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.template import Library
 from django.utils.http import urlquote
 
@@ -5,11 +6,15 @@ register = Library()
 
 @register.inclusion_tag('votes/vote_form.html', takes_context=True)
 def show_vote_form(context, item, user):
-    """Shows the vote form."""
+    """Shows the vote form. Anonymous users get forms that take them to
+    the login page, without CSRF tokens, so that their pages are cacheable.
+    """
     # FIXME: Move positive and negative class to article.
     request = context['request']
-    next = urlquote(request.path + '?' + request.GET.urlencode())
-    action = item.get_vote_url() + "?next={}".format(next)
-    vote = item.get_vote(user) if user.is_authenticated() else None
+    path = request.path + '?' + request.GET.urlencode()
+    if not user.is_authenticated():
+        return dict(action=settings.LOGIN_URL, next=path, state='neutral')
+    action = item.get_vote_url() + "?next={}".format(urlquote(path))
+    vote = item.get_vote(user)
     state = vote.get_description() if vote is not None else 'neutral'
     return dict(action=action, state=state)
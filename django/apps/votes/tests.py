@@ -0,0 +1,100 @@
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from mock import patch
+
+from submissions.models import Submission
+from submissions.tests import SubmissionFactory
+from users.tests import UserFactory, do_login
+from . import aggregates, buffer
+from .models import prefetch_votes
+
+
+@override_settings(VOTE_BUFFERING=True)
+@patch('votes.tasks.flush_votes_task.apply_async')
+class VoteBufferTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        buffer.get_store().delete(buffer.PENDING_KEY, buffer.SCHEDULED_KEY)
+
+    def test_votes_are_recorded(self, apply_async):
+        """Buffered votes are saved right away."""
+        submission = SubmissionFactory()
+        initial_count = submission.submissionvote_set.count()
+        do_login(self.client, UserFactory())
+        self.client.post(submission.get_vote_url(), {'vote': 'up'})
+        final_count = submission.submissionvote_set.count()
+        self.assertEqual(final_count, initial_count + 1)
+
+    def test_votes_are_coalesced(self, apply_async):
+        """Many votes on the same item schedule a single flush and
+        rescore the item once.
+        """
+        submission = SubmissionFactory()
+        for i in range(3):
+            submission.buffer_vote(UserFactory(), 'up')
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.flush(), 0)
+
+
+class VoteAggregateTest(TestCase):
+
+    def test_aggregates_follow_votes(self):
+        """Creating and changing votes updates the running aggregates."""
+        submission = SubmissionFactory()
+        self.assertEqual(submission.vote_count, 1)
+        self.assertEqual(submission.positive_count, 1)
+        user = UserFactory()
+        submission.cast_vote(user, 'down')
+        submission.cast_vote(user, 'down')  # Same way twice is neutral.
+        submission = Submission.objects.get(pk=submission.pk)
+        self.assertEqual(submission.vote_count, 2)
+        self.assertEqual(submission.positive_count, 1)
+        self.assertEqual(submission.negative_count, 0)
+        self.assertEqual(list(aggregates.drift(Submission)), [])
+
+    def test_outdated_save_keeps_aggregates(self):
+        """Saving an outdated instance doesn't overwrite newer votes."""
+        submission = SubmissionFactory()
+        outdated = Submission.objects.get(pk=submission.pk)
+        submission.cast_vote(UserFactory(), 'up')
+        outdated.save()
+        submission = Submission.objects.get(pk=submission.pk)
+        self.assertEqual(submission.vote_count, 2)
+
+    def test_filtered_aggregates(self):
+        """Filtered aggregates leave out rejected votes, like the rest."""
+        submission = SubmissionFactory()
+        user = UserFactory()
+        submission.cast_vote(user, 'down')
+        self.assertEqual(submission.get_vote_count(value=-1), 1)
+        submission.submissionvote_set.filter(user=user).update(is_rejected=True)
+        self.assertEqual(submission.get_vote_count(value=-1), 0)
+        self.assertEqual(submission.get_value_sum(user=user), 0)
+
+    def test_drift_is_detected(self):
+        submission = SubmissionFactory()
+        Submission.objects.filter(pk=submission.pk).update(vote_count=7)
+        drifted = list(aggregates.drift(Submission))
+        self.assertEqual(len(drifted), 1)
+        pk, stored, expected = drifted[0]
+        aggregates.fix(Submission, pk, expected)
+        self.assertEqual(list(aggregates.drift(Submission)), [])
+
+
+class VotePrefetchTest(TestCase):
+
+    def test_prefetched_votes(self):
+        """Votes of a user on a list of items take a single query."""
+        user = UserFactory()
+        submissions = [SubmissionFactory() for i in range(3)]
+        submissions[0].cast_vote(user, 'up')
+        submissions = list(Submission.objects.order_by('pk'))
+        with self.assertNumQueries(1):
+            prefetch_votes(submissions, user)
+        with self.assertNumQueries(0):
+            votes = [s.get_vote(user) for s in submissions]
+        self.assertTrue(votes[0].value > 0)
+        self.assertEqual(votes[1:], [None, None])
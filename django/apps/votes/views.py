@@ -23,7 +23,7 @@ class VoteView(SingleObjectMixin, View):
         if way not in ('up', 'down'):
             return HttpResponseBadRequest(_("Invalid data."))
         self.object = self.get_object()
-        vote = self.object.cast_vote(request.user, way)
+        vote = self.object.buffer_vote(request.user, way)
         if request.is_ajax():
             return HttpResponse(
                 json.dumps({'status': vote.get_description()}),
@@ -1,9 +1,6 @@
-from django.conf import settings
-
-from .models import Zone
+from .navigation import get_top_zones, lazy
 
 
 def default_zone_list(request):
     """Adds the default zones to the context."""
-    zones = Zone.objects.all()[:settings.ZONE_LIST_SIZE]
-    return {'default_zone_list': zones}
+    return {'default_zone_list': lazy(get_top_zones)}
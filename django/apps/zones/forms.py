@@ -23,7 +23,7 @@ class ZoneCreateForm(SimpleModelForm):
         aux, slug = clean_slug(name)
         if slug == 'new':
             raise forms.ValidationError(_("Invalid name."))
-        if Zone.objects.filter(slug__iexact=slug).exists():
+        if Zone.objects.filter(slug=slug).exists():
             raise forms.ValidationError(_("Name conflict with existing zone."))
         return name
 
@@ -96,7 +96,7 @@ class ProposalCreateForm(SimpleModelForm):
         aux, slug = clean_slug(name)
         if slug == 'new':
             raise forms.ValidationError(_("Invalid name."))
-        exists = lambda model: model.objects.filter(slug__iexact=slug).exists()
+        exists = lambda model: model.objects.filter(slug=slug).exists()
         if exists(Proposal) or exists(Zone):
             raise forms.ValidationError(_("Name conflict with existing zone."))
         return name
@@ -0,0 +1,41 @@
+"""Answers which zones a user moderates or is subscribed to.
+The `Permission` and `Subscription` rows of a user are loaded once, the
+first time they are needed, and kept in the user object. Since views get
+a fresh `request.user` each request, that's a cache per request.
+"""
+
+
+class Membership(object):
+
+    def __init__(self, user):
+        self.user = user
+        self._permissions = None
+        self._subscriptions = None
+
+    @property
+    def permissions(self):
+        """Dict of <zone id, permission> of the zones the user moderates."""
+        if self._permissions is None:
+            permissions = self.user.permission_set.all()
+            self._permissions = dict((p.zone_id, p) for p in permissions)
+        return self._permissions
+
+    @property
+    def subscriptions(self):
+        """Set of ids of the zones the user is subscribed to."""
+        if self._subscriptions is None:
+            zones = self.user.subscription_set.values_list('zone', flat=True)
+            self._subscriptions = set(zones)
+        return self._subscriptions
+
+
+def get_membership(user):
+    membership = getattr(user, '_membership', None)
+    if membership is None:
+        membership = user._membership = Membership(user)
+    return membership
+
+
+def invalidate(user):
+    """Forgets the loaded rows, after the memberships of `user` change."""
+    user._membership = None
@@ -1,21 +1,33 @@
 import math
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext as _
 
-from misc.models import Author, Created, Private
+from misc import counters, pages
+from misc.models import Author, Created, Private, skip_fields
 from misc.utils import clean_slug
+from submissions import feeds
 from votes.models import Vote, Voted, ZVote, ZVoted
 from users.models import User
+from .membership import get_membership, invalidate
+from .navigation import invalidate_subscribed
 
 
 class ZoneManager(models.Manager):
+    _slugs = {}  # Slugs never change, they are kept for the process.
 
     def get_default(self):
         return self.get(pk=1)
 
+    def get_slug(self, pk):
+        """Returns the slug of the zone `pk`, queried once per process."""
+        if pk not in self._slugs:
+            slugs = self.filter(pk=pk).values_list('slug', flat=True)
+            self._slugs[pk] = slugs[0]
+        return self._slugs[pk]
+
 
 class ZoneVote(ZVote):
     """Concrete Vote class."""
@@ -71,10 +83,18 @@ class Zone(Created, Private, ZVoted):
     def zone(self):
         return self
 
+    EWMA_FIELDS = ['vote_ewma', 'score_ewma']
+
     def save(self, **kwargs):
         if self.id is None:
             self.name, self.slug = clean_slug(self.name)
+        skip_fields(self, kwargs, ['size'])  # See `subscribe`.
         super(Zone, self).save(**kwargs)
+        # Votes change the averages and scores often, pages catch up later.
+        hidden = self.EWMA_FIELDS + self.get_score_fields()
+        update_fields = kwargs.get('update_fields')
+        if not update_fields or not set(update_fields) <= set(hidden):
+            pages.invalidate('zone:{}'.format(self.slug))
 
     # Subscriptions
     subscriber_set = models.ManyToManyField(
@@ -87,17 +107,27 @@ class Zone(Created, Private, ZVoted):
     def is_subscriber(self, user):
         if not user.is_authenticated():
             return False
-        return self.subscription_set.filter(user=user).exists()
+        return self.pk in get_membership(user).subscriptions
 
     def subscribe(self, user):
-        Subscription.objects.get_or_create(zone=self, user=user)
-        self.size = self.subscriber_set.count()
-        self.save()
+        created = Subscription.objects.get_or_create(zone=self, user=user)[1]
+        invalidate(user)
+        invalidate_subscribed(user)
+        feeds.invalidate_home(user)
+        if created:
+            counters.increment(self, 'size')
 
     def unsubscribe(self, user):
-        self.subscription_set.filter(user=user).delete()
-        self.size = self.subscriber_set.count()
-        self.save()
+        with transaction.atomic():
+            # Locked, of concurrent calls only one finds the row.
+            subscriptions = self.subscription_set.filter(user=user)
+            deleted = len(subscriptions.select_for_update().values_list('pk'))
+            subscriptions.delete()
+        invalidate(user)
+        invalidate_subscribed(user)
+        feeds.invalidate_home(user)
+        if deleted:
+            counters.increment(self, 'size', -deleted)
 
     # Permissions
     moderator_set = models.ManyToManyField(
@@ -107,16 +137,18 @@ class Zone(Created, Private, ZVoted):
         related_name='moderated_zone_set',
         )
 
+    def get_permission(self, user):
+        """Returns the permission of `user` in the zone, or None."""
+        if not user.is_authenticated():
+            return None
+        return get_membership(user).permissions.get(self.pk)
+
     def is_moderator(self, user):
-        is_user = user.is_authenticated()
-        return is_user and self.permission_set.filter(user=user).exists()
+        return self.get_permission(user) is not None
 
     def is_admin(self, user):
-        try:
-            is_user = user.is_authenticated()
-            return is_user and self.permission_set.get(user=user).is_admin
-        except Zone.DoesNotExist:
-            return False
+        permission = self.get_permission(user)
+        return permission is not None and permission.is_admin
 
     def is_superior(self, strong, weak):
         if strong == weak:
@@ -125,12 +157,13 @@ class Zone(Created, Private, ZVoted):
             return False
         if not self.is_moderator(weak):
             return True
-        strong_perm = self.permission_set.get(user=strong)
-        weak_perm = self.permission_set.get(user=weak)
+        strong_perm = self.get_permission(strong)
+        weak_perm = self.get_permission(weak)
         return strong_perm > weak_perm
 
     def add_founder(self, target):
         Permission.objects.get_or_create(zone=self, user=target)
+        invalidate(target)
         self.subscribe(target)
 
     def grant_permission(self, target, moderator):
@@ -145,6 +178,7 @@ class Zone(Created, Private, ZVoted):
         if Permission.objects.filter(zone=self, user=target).exists():
             raise ValueError("User is already a moderator")
         Permission.objects.create(zone=self, user=target)
+        invalidate(target)
 
     def revoke_permission(self, target, moderator):
         super_mod = moderator.is_superuser
@@ -155,6 +189,7 @@ class Zone(Created, Private, ZVoted):
         if not Permission.objects.filter(zone=self, user=target).exists():
             raise ValueError("User is not a moderator")
         self.permission_set.filter(user=target).delete()
+        invalidate(target)
 
     def permissions(self):
         return self.permission_set.all()
@@ -262,7 +297,12 @@ class Proposal(Author, Created, Voted):
         max_length=settings.ZONE_DESCRIPTION_LENGTH,
         verbose_name=_('short description'),
         )
+    progress = models.FloatField(
+        editable=False,
+        default=0,
+        )
     vote_through = ProposalVote
+    vote_buffering = False  # Each vote may create the zone.
     voter_set = models.ManyToManyField(
         editable=False,
         to='users.User',
@@ -283,29 +323,43 @@ class Proposal(Author, Created, Voted):
 
     def cast_vote(self, user, value):
         vote  = super(Proposal, self).cast_vote(user, value)
-        # Decide wether to create or not the zone.
-        if self.score >= self.threshold:
-            zone = Zone()
-            zone.name = self.name
-            zone.description = self.description
-            zone.save()
-            zone.add_founder(self.author)
-            self.delete()
+        self.accept()
         return vote
 
+    def accept(self):
+        """Creates the zone once the progress reaches 100, and returns it."""
+        if self.progress < 100:
+            return None
+        zone = Zone()
+        zone.name = self.name
+        zone.description = self.description
+        zone.save()
+        zone.add_founder(self.author)
+        self.delete()
+        return zone
+
     @property
     def threshold(self):
-        return 5 * math.log(User.objects.count())
+        # No active users yet is a normal state for a new site.
+        return 5 * math.log(max(1, User.objects.active_count()))
 
     @property
     def score(self):
-        score = self.proposalvote_set.filter(value__gt=0).count()
+        score = self.positive_count
         bonus = (self.get_value_avg() + 1) / 4 * self.threshold
         return score + bonus
 
-    @property
-    def progress(self):
-        return "{:0.0f}%".format(100 * self.score / self.threshold)
+    def get_progress(self):
+        """Percentage of the threshold reached, the zone is created at 100."""
+        threshold = self.threshold
+        return 100 * self.score / threshold if threshold else 100
+
+    def compute_scores(self):
+        super(Proposal, self).compute_scores()
+        self.progress = self.get_progress()
+
+    def get_score_fields(self):
+        return super(Proposal, self).get_score_fields() + ['progress']
 
     def __unicode__(self):
         return self.name
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from misc.stores import get_store
+
+"""Zone lists of the navigation menus, shown in almost every page.
+The top zones are kept by every process for `settings.ZONE_LIST_TIMEOUT`
+seconds. The zones a user is subscribed to are kept in the store until
+the subscriptions change. Context processors pass them to templates as
+callables, so pages that don't show the menus don't load them either.
+"""
+
+_top_zones = (None, 0)  # <zones, expiry time>
+_lock = threading.Lock()
+
+
+def get_top_zones():
+    """Returns the first `settings.ZONE_LIST_SIZE` zones."""
+    global _top_zones
+    from .models import Zone
+    zones, expires = _top_zones
+    if zones is None or expires < time.time():
+        zones = list(Zone.objects.all()[:settings.ZONE_LIST_SIZE])
+        with _lock:
+            _top_zones = (zones, time.time() + settings.ZONE_LIST_TIMEOUT)
+    return zones
+
+
+def subscribed_key(user):
+    return 'zones:subscribed:{}'.format(user.pk)
+
+
+def get_subscribed_zones(user):
+    """Returns the zones `user` is subscribed to, with their names and
+    slugs only, enough for links.
+    """
+    from .models import Zone
+    store = get_store()
+    key = subscribed_key(user)
+    cached = store.get(key)
+    if cached is None:
+        zones = user.subscribed_zone_set.values_list('pk', 'name', 'slug')
+        cached = json.dumps(list(zones))
+        timeout = settings.SUBSCRIBED_ZONE_LIST_TIMEOUT
+        store.set(key, cached, timeout=timeout)
+    return [
+        Zone(pk=pk, name=name, slug=slug)
+        for pk, name, slug in json.loads(cached)
+        ]
+
+
+def invalidate_subscribed(user):
+    """Drops the cached subscriptions, after they change."""
+    get_store().delete(subscribed_key(user))
+
+
+def lazy(function, *args):
+    """Returns a callable that templates call for the result of `function`,
+    called once at most.
+    """
+    result = []
+
+    def call():
+        if not result:
+            result.append(function(*args))
+        return result[0]
+    return call
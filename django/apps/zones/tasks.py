@@ -0,0 +1,18 @@
+from celery import task
+
+from users.models import User
+from .models import Proposal
+
+@task()
+def refresh_proposals_task():
+    """Refreshes the active user count and, since their threshold depends
+    on it, the progress of every proposal. Proposals past the new threshold
+    become zones.
+    """
+    User.objects.refresh_active_count()
+    proposals = Proposal.objects.all()
+    for proposal in proposals:
+        proposal.progress = proposal.get_progress()
+        proposal.save(update_fields=['progress'])
+        proposal.accept()
+    return len(proposals)
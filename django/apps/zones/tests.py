@@ -4,8 +4,11 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
 
+from users.models import User
 from users.tests import UserFactory, AdminFactory, do_login
-from .models import Zone
+from . import navigation
+from .models import Proposal, Zone
+from .tasks import refresh_proposals_task
 
 
 class ZoneFactory(factory.DjangoModelFactory):
@@ -118,6 +121,57 @@ class SimpleTest(TestCase):
         self.assertTrue(self.zone.is_moderator(user))
         self.assertTrue(self.zone.is_subscriber(user))
 
+    def test_membership_queries(self):
+        """Memberships of a user are loaded once for every zone."""
+        user = UserFactory()
+        zones = [ZoneFactory() for i in range(3)]
+        zones[0].add_founder(user)
+        user = User.objects.get(pk=user.pk)
+        with self.assertNumQueries(2):
+            for zone in zones:
+                zone.is_moderator(user)
+                zone.is_admin(user)
+                zone.is_subscriber(user)
+        self.assertTrue(zones[0].is_moderator(user))
+        self.assertFalse(zones[1].is_subscriber(user))
+
+    def test_subscribed_zone_list(self):
+        """Subscriptions are cached until they change."""
+        user = UserFactory()
+        zone = ZoneFactory()
+        navigation.invalidate_subscribed(user)
+        zone.subscribe(user)
+        self.assertEqual(navigation.get_subscribed_zones(user), [zone])
+        with self.assertNumQueries(0):
+            zones = navigation.get_subscribed_zones(user)
+        self.assertEqual(zones[0].get_absolute_url(), zone.get_absolute_url())
+        zone.unsubscribe(user)
+        self.assertEqual(navigation.get_subscribed_zones(user), [])
+
+    def test_proposal_progress(self):
+        """Proposals store their progress when voted."""
+        for i in range(3):
+            UserFactory()
+        User.objects.refresh_active_count()
+        proposal = Proposal(name="Proposal", author=UserFactory())
+        proposal.save()
+        proposal = Proposal.objects.get(pk=proposal.pk)
+        self.assertTrue(0 < proposal.progress < 100)
+
+    def test_proposal_threshold_drop(self):
+        """Proposals past a lower threshold become zones on refresh, and
+        no active users at all is fine.
+        """
+        for i in range(3):
+            UserFactory()
+        User.objects.refresh_active_count()
+        proposal = Proposal(name="Dropped", author=UserFactory())
+        proposal.save()
+        User.objects.update(is_active=False)
+        refresh_proposals_task()
+        self.assertFalse(Proposal.objects.filter(pk=proposal.pk).exists())
+        self.assertTrue(Zone.objects.filter(slug=proposal.slug).exists())
+
     # Access
 
     def test_create_login(self):
@@ -14,8 +14,11 @@ from django.views.generic.list import ListView
 
 from users.models import User
 from users.decorators import login_required_view, admin_required_view
+from misc.decorators import anonymous_cache_view
 from misc.mixins import OrderedItemListMixin
+from submissions import feeds
 from submissions.forms import ZoneSubmissionCreateForm
+from votes.models import prefetch_votes
 from votes.views import VoteView
 from .decorators import moderator_required_view
 from .mixins import ZoneMixin
@@ -35,12 +38,14 @@ class IndexView(ListView):
     template_name = 'zones/index_page.html'
 
 
+@anonymous_cache_view('zone:{slug}')
 class AboutView(ZoneMixin, DetailView):
     model = Zone
     template_name = 'zones/about_page.html'
     section = _("Zone")
 
 
+@anonymous_cache_view('zone:{slug}')
 class MainView(ZoneMixin, OrderedItemListMixin, DetailView):
     model = Zone
     template_name = 'zones/base_page.html'
@@ -54,7 +59,8 @@ class MainView(ZoneMixin, OrderedItemListMixin, DetailView):
             order=order,
             is_rejected=False,
             ).select_related('zone', 'author')
-        return submissions
+        user = self.request.user
+        return feeds.get_list(submissions, user, order, zone=self.object.pk)
 
 
 # User views
@@ -131,6 +137,14 @@ class ProposalIndexView(ListView):
     model = Proposal
     template_name = 'zones/proposals_page.html'
 
+    def get_queryset(self):
+        return Proposal.objects.select_related('author')
+
+    def get_context_data(self, **kwargs):
+        context = super(ProposalIndexView, self).get_context_data(**kwargs)
+        prefetch_votes(context['object_list'], self.request.user)
+        return context
+
 
 @login_required_view
 class ProposalVoteView(VoteView):
@@ -135,10 +135,25 @@ LOGIN_URL = '/account/login/'
 CRISPY_TEMPLATE_PACK = 'bootstrap'
 
 # Celery & Redis:
+from datetime import timedelta
 import djcelery
 djcelery.setup_loader()
-BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+REDIS_URL = 'redis://localhost:6379/0'
+BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
+CELERYBEAT_SCHEDULE = {
+    'rescore-submissions': {
+        'task': 'submissions.tasks.rescore_task',
+        'schedule': timedelta(minutes=10),
+        },
+    'refresh-proposals': {
+        'task': 'zones.tasks.refresh_proposals_task',
+        'schedule': timedelta(minutes=10),
+        },
+    }
+
+# Shared state between web and celery workers, see misc.stores:
+STORE_BACKEND = 'misc.stores.RedisStore'
 
 # Amazon S3 Storage:
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto.S3BotoStorage'
@@ -146,10 +161,23 @@ DEFAULT_FILE_STORAGE = 'storages.backends.s3boto.S3BotoStorage'
 # Random limits:
 SUBMISSIONS_PER_PAGE = 20
 
+# Domains:
+DOMAIN_CACHE_SIZE = 10000  # Hosts remembered by each process.
+
+# Moderation, see misc.cascade:
+CASCADE_BATCH_SIZE = 500  # Rows updated per transaction.
+CASCADE_TIMEOUT = 24 * 60 * 60  # In seconds, progress is kept that long.
+
 # Submissions:
 SUBMISSION_TITLE_LENGTH = 100
 SUBMISSION_SLUG_LENGTH = 110
 EDIT_TIME = 10 * 60  # In seconds.
+RESCORE_DAYS = 7  # Older submissions keep their last scores.
+RESCORE_BUDGET = 5 * 60  # In seconds, rescoring stops after that.
+RESCORE_CHUNK_SIZE = 2000
+FEED_SIZE = 1000  # Submissions kept per feed, see submissions.feeds.
+HOME_FEED_DEPTH = 100  # Submissions merged at once for a home feed.
+HOME_FEED_TIMEOUT = 60  # In seconds, new submissions show up after that.
 
 # Zones:
 ZONE_NAME_LENGTH = 20
@@ -157,14 +185,37 @@ ZONE_DESCRIPTION_LENGTH = 200
 ZONE_INFORMATION_LENGTH = 2000
 MODERATOR_LIMIT = 5  # Moderators allowed per zone.
 ZONE_LIST_SIZE = 20  # Zones in the navigation menu.
+ZONE_LIST_TIMEOUT = 60  # In seconds, see zones.navigation.
+SUBSCRIBED_ZONE_LIST_TIMEOUT = 24 * 60 * 60  # In seconds.
 
 # Users:
 USER_NAME_LENGTH = 20
 SUBSCRIPTION_LIMIT = 10  # Subscriptions allowed per user.
+ACTIVE_USER_COUNT_TIMEOUT = 30 * 60  # In seconds, refreshed before that.
+
+# Comments:
+COMMENT_PATH_LENGTH = 500  # Fits replies 50 levels deep.
 
 # Messages:
 MESSAGE_LENGTH = 9999
 
+# Page cache for anonymous users, see misc.pages:
+PAGE_CACHE_TIMEOUT = 5 * 60  # In seconds, pages are fresh that long.
+PAGE_CACHE_STALE_TIMEOUT = 60 * 60  # In seconds, served while regenerated.
+PAGE_CACHE_LOCK_TIMEOUT = 30  # In seconds, for a single regeneration.
+MICROCACHE_TIMEOUT = 60  # In seconds, max-age of public pages for nginx.
+PAGE_PURGE_URL = ''  # Prefix of the paths to purge, nothing is purged if empty.
+PAGE_PURGE_TIMEOUT = 2  # In seconds, for each purge request.
+
+# Templates:
+FRAGMENT_CACHE_TIMEOUT = 60  # In seconds, bounds how old timestamps get.
+
 # Thumbnails:
 THUMBNAIL_SIZE = (110, 64)
+THUMBNAIL_SCALES = (1, 2)  # Pixel densities, for srcset.
+THUMBNAIL_FORMATS = ('jpeg', 'webp')  # WebP is skipped without libwebp.
+
+# Votes:
+VOTE_BUFFERING = False  # Rescore voted items in the background.
+VOTE_BUFFER_WINDOW = 5  # Seconds between rescores of the same item.
 
@@ -1,4 +1,5 @@
 import os
+import sys
 
 from django.core.exceptions import ImproperlyConfigured
 
@@ -80,3 +81,7 @@ INTERNAL_IPS = ('127.0.0.1', )  # Used by debug toolbar
 DEBUG_TOOLBAR_CONFIG = {
     'INTERCEPT_REDIRECTS': False,
 }
+
+# Tests keep shared state in memory:
+if 'test' in sys.argv:
+    STORE_BACKEND = 'misc.stores.LocalStore'
@@ -4,6 +4,8 @@ DEBUG = False
 
 ALLOWED_HOSTS = ['*']
 
+PAGE_PURGE_URL = 'http://127.0.0.1/purge'
+
 SECRET_KEY = '{{ pillar["django"]["secret_key"] }}'
 
 DATABASES = {